@@ -0,0 +1,56 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+class ConditionalGetMixin:
+    """ Условные GET запросы для list и retrieve.
+
+    ETag и Last-Modified считаются по меткам изменений (get_list_stamps,
+    get_object_stamps) до выборки и сериализации данных. Если клиент
+    прислал совпадающий If-None-Match, ответ — 304 без тела.
+    """
+
+    def get_list_stamps(self):
+        """ Метки списка или None: ответ без ETag. """
+
+    def get_object_stamps(self):
+        """ Метки объекта или None, если объекта нет. """
+
+    def get_etag(self, stamps):
+        request = self.request
+        key = repr((
+            self.basename, self.action, sorted(self.kwargs.items()),
+            sorted(request.query_params.lists()),
+            request.accepted_media_type,
+            request.user.pk, stamps,
+        ))
+        return f'W/"{hashlib.md5(key.encode()).hexdigest()}"'
+
+    def conditional_response(self, stamps, handler, request, *args, **kwargs):
+        if stamps is None:
+            return handler(request, *args, **kwargs)
+        etag = self.get_etag(stamps)
+        last_modified = int(max(stamps))
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if 200 <= response.status_code < 400:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_list_stamps(), super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_object_stamps(), super().retrieve,
+            request, *args, **kwargs
+        )
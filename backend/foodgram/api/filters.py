@@ -1,13 +1,31 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, Q
 from django_filters.rest_framework import FilterSet
 from django_filters.rest_framework.filters import (AllValuesMultipleFilter,
-                                                   BooleanFilter)
-from recipes.models import Recipe
+                                                   BooleanFilter, CharFilter)
+from recipes.models import SEARCH_CONFIG, Recipe
+from recipes.search import search_ingredients
 from rest_framework.filters import SearchFilter
 
 
 class IngredientSearchFilter(SearchFilter):
+    """ Поиск ингредиентов в БД по параметру name. """
+
     search_param = 'name'
 
+    def get_search_name(self, request):
+        return ' '.join(self.get_search_terms(request))
+
+    def filter_queryset(self, request, queryset, view):
+        name = self.get_search_name(request)
+        if not name:
+            return queryset
+        return search_ingredients(
+            queryset, name, settings.INGREDIENT_SEARCH_LIMIT
+        )
+
 
 class RecipeFilterSet(FilterSet):
     tags = AllValuesMultipleFilter(
@@ -16,17 +34,33 @@ class RecipeFilterSet(FilterSet):
     is_in_shopping_cart = BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(in_favorite__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(shoppingcart__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset.all()
+
+    def get_search(self, queryset, name, value):
+        if connection.vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=value)
+                | Q(text__icontains=value)
+                | Q(ingredients__name__icontains=value)
+            ).distinct()
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date', '-id')
@@ -0,0 +1,287 @@
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from recipes.models import Favourite, Ingredient, Recipe, Tag
+from recipes.seed import seed_database
+from rest_framework.authtoken.models import Token
+from users.models import Subscription, User
+
+# Эндпоинты нагрузки. Каждый запрос берёт путь из функции, чтобы
+# рецепты и строки поиска менялись от запроса к запросу.
+ENDPOINTS = (
+    ('feed', lambda data, rng: ('/api/recipes/', {'limit': 6})),
+    ('feed_by_tag', lambda data, rng: ('/api/recipes/', {
+        'limit': 6, 'tags': rng.choice(data['tags']),
+    })),
+    ('recipe', lambda data, rng: (
+        f'/api/recipes/{rng.choice(data["recipes"])}/', {}
+    )),
+    ('ingredient_search', lambda data, rng: ('/api/ingredients/', {
+        'name': rng.choice(data['ingredients']),
+    })),
+    ('subscriptions', lambda data, rng: ('/api/users/subscriptions/', {
+        'limit': 6, 'recipes_limit': 3,
+    })),
+    ('download_shopping_cart', lambda data, rng: (
+        '/api/recipes/download_shopping_cart/', {}
+    )),
+)
+
+
+def percentile(values, rank):
+    """ Перцентиль rank (0–100) по отсортированному списку, в мс. """
+    if not values:
+        return None
+    return round(values[max(math.ceil(rank / 100 * len(values)) - 1, 0)], 1)
+
+
+class Command(BaseCommand):
+    """
+    Команда 'benchmark_api' — нагрузочный тест API на локальной базе.
+    Поднимает приложение (gunicorn или runserver) на 127.0.0.1 с той же
+    базой, что в настройках (PostgreSQL или файл SQLite), при
+    необходимости заполняет её и по очереди нагружает эндпоинты в
+    --concurrency потоков. Для каждого эндпоинта выводит JSON с
+    пропускной способностью и задержками p50/p95/p99, чтобы сравнивать
+    запуски между коммитами:
+
+        manage.py benchmark_api --users 10000 --recipes 100000 \\
+            --favourites 1000000 --output before.json
+
+    С --url нагружается уже запущенный сервер, например
+    docker-compose на localhost.
+    """
+
+    help = 'Нагрузочный тест основных эндпоинтов API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=0,
+            help='Сколько пользователей добавить перед тестом.'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=0,
+            help='Сколько рецептов добавить перед тестом.'
+        )
+        parser.add_argument(
+            '--favourites', type=int, default=0,
+            help='Сколько строк избранного добавить.'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=0,
+            help='Сколько строк корзин добавить.'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=0,
+            help='Сколько подписок добавить.'
+        )
+        parser.add_argument(
+            '--random-seed', type=int, default=1,
+            help='Зерно генератора данных и запросов.'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Число одновременных клиентов.'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Запросов на эндпоинт.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=10,
+            help='Запросов на эндпоинт до замера.'
+        )
+        parser.add_argument(
+            '--server', choices=('gunicorn', 'runserver'),
+            default='gunicorn',
+            help='Чем запускать приложение.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help='Процессы gunicorn.'
+        )
+        parser.add_argument(
+            '--url',
+            help='Адрес уже запущенного сервера вместо своего.'
+        )
+        parser.add_argument(
+            '--endpoints', nargs='+',
+            choices=[name for name, _ in ENDPOINTS],
+            help='Только эти эндпоинты.'
+        )
+        parser.add_argument(
+            '--output',
+            help='JSON-файл для результата; по умолчанию stdout.'
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] or options['recipes']:
+            seed_database(
+                users=options['users'], recipes=options['recipes'],
+                favourites=options['favourites'], carts=options['carts'],
+                subscriptions=options['subscriptions'],
+                random_seed=options['random_seed'],
+            )
+        data = self.load_data()
+        server = None
+        url = options['url']
+        if url is None:
+            if connection.vendor == 'sqlite' and (
+                settings.DATABASES['default']['NAME'] == ':memory:'
+            ):
+                raise CommandError('Для SQLite нужна база в файле.')
+            server, url = self.start_server(options)
+        # Соединение не должно висеть открытым во время нагрузки.
+        connection.close()
+        try:
+            endpoints = {}
+            for name, make_request in ENDPOINTS:
+                if options['endpoints'] and name not in options['endpoints']:
+                    continue
+                endpoints[name] = self.run_endpoint(
+                    url, data, make_request, options
+                )
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+        report = {
+            'commit': self.get_commit(),
+            'vendor': connection.vendor,
+            'server': 'external' if options['url'] else options['server'],
+            'workers': options['workers'],
+            'concurrency': options['concurrency'],
+            'rows': data['rows'],
+            'endpoints': endpoints,
+        }
+        result = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(result + '\n')
+        else:
+            self.stdout.write(result)
+
+    def load_data(self):
+        """ Клиент и значения для запросов: пользователь с наибольшим
+            числом подписок и корзиной, id рецептов, теги, строки
+            поиска ингредиентов. """
+        user = User.objects.annotate(
+            activity=Count('follower', distinct=True)
+            + Count('shoppingcart', distinct=True)
+        ).order_by('-activity', 'id').first()
+        recipes = list(Recipe.objects.order_by('?').values_list(
+            'id', flat=True
+        )[:1000])
+        if user is None or not recipes:
+            raise CommandError(
+                'В базе нет рецептов, задайте --users и --recipes.'
+            )
+        names = Ingredient.objects.values_list('name', flat=True)[:200]
+        return {
+            'token': Token.objects.get_or_create(user=user)[0].key,
+            'recipes': recipes,
+            'tags': list(Tag.objects.values_list('slug', flat=True)),
+            'ingredients': sorted({name[:3] for name in names}),
+            'rows': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'favourites': Favourite.objects.count(),
+                'subscriptions': Subscription.objects.count(),
+            },
+        }
+
+    def start_server(self, options):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        if options['server'] == 'gunicorn':
+            command = [
+                sys.executable, '-m', 'gunicorn', 'foodgram.wsgi:application',
+                '--bind', f'127.0.0.1:{port}',
+                '--workers', str(options['workers']),
+                '--log-level', 'warning',
+            ]
+        else:
+            command = [
+                sys.executable, 'manage.py', 'runserver', '--noreload',
+                f'127.0.0.1:{port}',
+            ]
+        server = subprocess.Popen(
+            command, cwd=settings.BASE_DIR, env=os.environ.copy(),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'Сервер не запустился: {command}')
+            try:
+                socket.create_connection(('127.0.0.1', port), 1).close()
+                break
+            except OSError:
+                time.sleep(0.2)
+        else:
+            server.terminate()
+            raise CommandError('Сервер не отвечает.')
+        return server, f'http://127.0.0.1:{port}'
+
+    def run_endpoint(self, url, data, make_request, options):
+        rng = random.Random(options['random_seed'])
+        requests = [
+            make_request(data, rng)
+            for _ in range(options['warmup'] + options['requests'])
+        ]
+
+        def send(request):
+            path, params = request
+            if params:
+                path = f'{path}?{urlencode(params)}'
+            http_request = Request(url + path, headers={
+                'Authorization': f'Token {data["token"]}',
+            })
+            start = time.perf_counter()
+            try:
+                with urlopen(http_request, timeout=60) as response:
+                    response.read()
+                    ok = response.status == 200
+            except (HTTPError, URLError, OSError):
+                ok = False
+            return time.perf_counter() - start, ok
+
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            list(pool.map(send, requests[:options['warmup']]))
+            start = time.perf_counter()
+            results = list(pool.map(send, requests[options['warmup']:]))
+            elapsed = time.perf_counter() - start
+        latencies = sorted(duration * 1000 for duration, ok in results if ok)
+        return {
+            'requests': len(results),
+            'errors': len(results) - len(latencies),
+            'throughput_rps': round(len(results) / elapsed, 1),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+        }
+
+    def get_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,201 @@
+import json
+import re
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.seed import seed_database
+from rest_framework.test import APIClient
+from users.models import User
+
+# Эндпоинты API, планы запросов которых записываются. В пути
+# подставляются id из заполненной базы: author — автор с наибольшим
+# числом рецептов, recipe — его последний рецепт.
+ENDPOINTS = (
+    ('recipes', '/api/recipes/?limit=6'),
+    ('recipes_by_author', '/api/recipes/?author={author}&limit=6'),
+    ('recipes_by_tag', '/api/recipes/?tags={tag}&limit=6'),
+    ('recipes_favorited', '/api/recipes/?is_favorited=1&limit=6'),
+    ('recipes_in_cart', '/api/recipes/?is_in_shopping_cart=1&limit=6'),
+    ('recipe', '/api/recipes/{recipe}/'),
+    ('subscriptions', '/api/users/subscriptions/?limit=6&recipes_limit=3'),
+    ('users', '/api/users/?limit=6'),
+    ('user', '/api/users/{author}/'),
+    ('download_shopping_cart', '/api/recipes/download_shopping_cart/'),
+    ('ingredients', '/api/ingredients/?name={ingredient}'),
+    ('tags', '/api/tags/'),
+)
+# Запросы через .iterator() в PostgreSQL идут серверным курсором:
+# перед SELECT стоит DECLARE ... CURSOR ... FOR.
+SERVER_CURSOR = re.compile(r'^\s*DECLARE\s.*?\sCURSOR\s.*?\bFOR\s', re.S)
+
+
+class Command(BaseCommand):
+    """
+    Команда 'explain_endpoints' выполняет GET-запросы к основным
+    эндпоинтам API от имени самого активного пользователя и записывает
+    план каждого SQL-запроса: EXPLAIN (FORMAT JSON) в PostgreSQL,
+    EXPLAIN QUERY PLAN в SQLite. Планы до и после миграции с индексами
+    сравниваются через --compare:
+
+        manage.py explain_endpoints --seed-scale 10
+        manage.py migrate recipes 0011 && manage.py migrate users 0001
+        manage.py explain_endpoints --output before.json
+        manage.py migrate
+        manage.py explain_endpoints --output after.json --compare before.json
+    """
+
+    help = 'Записывает планы SQL-запросов эндпоинтов API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            help='JSON-файл для планов; по умолчанию только сводка.'
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON-файл с прошлым запуском: вывести изменившиеся планы.'
+        )
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='EXPLAIN ANALYZE с временем выполнения (PostgreSQL).'
+        )
+        parser.add_argument(
+            '--seed-scale', type=int, default=0,
+            help='Сначала заполнить базу: 50 пользователей и 500 рецептов '
+                 'на единицу масштаба.'
+        )
+        parser.add_argument(
+            '--random-seed', type=int, default=1,
+            help='Зерно генератора для --seed-scale.'
+        )
+
+    def handle(self, *args, **options):
+        if options['seed_scale']:
+            scale = options['seed_scale']
+            seeded = seed_database(
+                users=50 * scale, recipes=500 * scale,
+                favourites=1000 * scale, carts=250 * scale,
+                subscriptions=250 * scale,
+                random_seed=options['random_seed'],
+            )
+            self.stdout.write(
+                f'Добавлено пользователей: {seeded["users"]}, '
+                f'рецептов: {seeded["recipes"]}.'
+            )
+        user = User.objects.annotate(
+            activity=Count('favorites', distinct=True)
+            + Count('shoppingcart', distinct=True)
+            + Count('follower', distinct=True)
+        ).order_by('-activity', 'id').first()
+        author = Recipe.objects.values('author').annotate(
+            recipes=Count('id')
+        ).order_by('-recipes', 'author').first()
+        if user is None or author is None:
+            raise CommandError(
+                'В базе нет рецептов, запустите с --seed-scale.'
+            )
+        ids = {
+            'author': author['author'],
+            'recipe': Recipe.objects.filter(
+                author=author['author']
+            ).values_list('id', flat=True).first(),
+            'tag': Tag.objects.values_list('slug', flat=True).first(),
+            'ingredient': Ingredient.objects.values_list(
+                'name', flat=True
+            ).first()[:3],
+        }
+        client = APIClient()
+        client.force_authenticate(user)
+        report = {
+            'vendor': connection.vendor,
+            'recipes': Recipe.objects.count(),
+            'users': User.objects.count(),
+            'endpoints': {},
+        }
+        for name, path in ENDPOINTS:
+            report['endpoints'][name] = self.explain_endpoint(
+                client, path.format(**ids), options['analyze']
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['endpoints']
+        for name, endpoint in report['endpoints'].items():
+            self.write_summary(
+                name, endpoint, previous and previous.get(name)
+            )
+
+    def explain_endpoint(self, client, path, analyze):
+        # Ответы и подсчёты из кэша не дошли бы до базы.
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        queries = [
+            sql for sql in (
+                SERVER_CURSOR.sub('', query['sql'])
+                for query in context.captured_queries
+            )
+            if sql.lstrip().upper().startswith(('SELECT', 'WITH'))
+        ]
+        return {
+            'path': path,
+            'status': response.status_code,
+            'queries': [
+                {'sql': sql, 'plan': self.explain(sql, analyze)}
+                for sql in queries
+            ],
+        }
+
+    def explain(self, sql, analyze):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                options = 'ANALYZE, BUFFERS, ' if analyze else ''
+                cursor.execute(f'EXPLAIN ({options}FORMAT JSON) {sql}')
+                return cursor.fetchone()[0]
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def write_summary(self, name, endpoint, previous):
+        self.stdout.write(
+            f'{name}: {endpoint["status"]}, '
+            f'запросов: {len(endpoint["queries"])}'
+        )
+        if previous is None:
+            return
+        before = [plan_nodes(query['plan']) for query in previous['queries']]
+        after = [plan_nodes(query['plan']) for query in endpoint['queries']]
+        if len(before) != len(after):
+            self.stdout.write(
+                f'  число запросов: {len(before)} -> {len(after)}'
+            )
+        for number, (old, new) in enumerate(zip(before, after), 1):
+            if old != new:
+                self.stdout.write(f'  запрос {number}:')
+                self.stdout.write(f'    было:  {"; ".join(old)}')
+                self.stdout.write(f'    стало: {"; ".join(new)}')
+
+
+def plan_nodes(plan):
+    """ Узлы плана: тип, таблица и индекс, без стоимостей и времени. """
+    if not plan or isinstance(plan[0], str):
+        return plan
+    nodes = []
+    stack = [plan[0]['Plan']]
+    while stack:
+        node = stack.pop()
+        nodes.append(' '.join(filter(None, (
+            node['Node Type'],
+            node.get('Relation Name'),
+            node.get('Index Name'),
+        ))))
+        stack.extend(reversed(node.get('Plans', ())))
+    return nodes
@@ -1,6 +1,202 @@
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     page_size = 6
+
+
+class ProbedPage(Page):
+    """ Страница, у которой есть ли следующая, решает лишняя строка
+        выборки, а не count. """
+
+    def has_next(self):
+        return self.next_exists
+
+
+class ApproximateCountPaginator(Paginator):
+    """ Paginator, который не считает COUNT(*) на каждый запрос.
+
+    Точное число берётся из кэша (PAGINATION_COUNT_CACHE_TIMEOUT),
+    иначе в PostgreSQL берётся оценка планировщика, и если она больше
+    PAGINATION_COUNT_ESTIMATE_THRESHOLD, COUNT(*) не выполняется.
+    Оценка и число из кэша идут только в поле count ответа: страница
+    выбирается по OFFSET с одной лишней строкой, которая показывает,
+    есть ли следующая, поэтому неточный count не обрезает выдачу.
+    """
+
+    count_is_exact = True
+
+    def count_cache_key(self):
+        sql, params = self.object_list.query.sql_with_params()
+        digest = hashlib.md5(
+            repr((self.object_list.db, sql, params)).encode()
+        ).hexdigest()
+        return f'pagination:count:{digest}'
+
+    def estimate_count(self):
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = self.object_list.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']['Plan Rows']
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        key = self.count_cache_key()
+        count = cache.get(key)
+        if count is not None:
+            return count
+        estimate = self.estimate_count()
+        if (estimate is not None
+                and estimate > settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD):
+            self.count_is_exact = False
+            return estimate
+        count = super().count
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def validate_number(self, number):
+        # Номер страницы не сверяется с num_pages: count может быть
+        # оценкой или устаревшим числом из кэша.
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть числом.')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1.')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        objects = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not objects and number > 1:
+            raise EmptyPage('На странице нет результатов.')
+        page = ProbedPage(objects[:self.per_page], number, self)
+        page.next_exists = len(objects) > self.per_page
+        return page
+
+
+class ApproximateCountPagination(CustomPagination):
+    """ Пагинация с приблизительным count и признаком count_is_exact. """
+
+    django_paginator_class = ApproximateCountPaginator
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data = OrderedDict([
+            ('count', response.data['count']),
+            ('count_is_exact', self.page.paginator.count_is_exact),
+            *(
+                (key, value) for key, value in response.data.items()
+                if key != 'count'
+            ),
+        ])
+        return response
+
+
+class RecipePagination(ApproximateCountPagination):
+    """ Пагинация ленты рецептов.
+
+    По умолчанию — номера страниц (page/limit). Если в запросе есть
+    параметр cursor (в том числе пустой), лента отдаётся по ключу
+    (pub_date, id) без COUNT(*) и OFFSET: следующая страница
+    начинается после последнего рецепта предыдущей. Курсор возможен
+    только при сортировке ленты по умолчанию: выдачу с другой
+    сортировкой, например по релевантности в поиске, он бы молча
+    пересортировал, поэтому такой запрос отклоняется.
+    """
+
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+    cursor_ordering_message = (
+        'Курсор нельзя совмещать с сортировкой выдачи, например '
+        'с поиском (search); используйте page.'
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        ordering = tuple(queryset.query.order_by) or tuple(
+            queryset.model._meta.ordering
+        )
+        if ordering != self.cursor_ordering:
+            raise ValidationError(
+                {self.cursor_query_param: [self.cursor_ordering_message]}
+            )
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.cursor_ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            pub_date, pk = position
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk),
+                pub_date__lte=pub_date,
+            )
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(last.pub_date, last.pk)
+        )
+
+    def encode_cursor(self, pub_date, pk):
+        return urlsafe_b64encode(
+            f'{pub_date.isoformat()}_{pk}'.encode()
+        ).decode()
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            pub_date, pk = urlsafe_b64decode(
+                cursor.encode()
+            ).decode().split('_')
+            return date.fromisoformat(pub_date), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
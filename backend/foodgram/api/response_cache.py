@@ -0,0 +1,159 @@
+import hashlib
+from time import monotonic, sleep
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+class ResponseCache:
+    """ Кэш готовых (отрендеренных) ответов API в кэше Django.
+
+    Хранит байты тела и Content-Type. Ключ включает метку изменений
+    данных, поэтому после изменения старые записи просто перестают
+    читаться и вытесняются по таймауту. Счётчики попаданий и промахов
+    лежат в том же кэше и общие для всех процессов, если кэш общий.
+    """
+
+    EVENTS = ('hits', 'misses')
+    LOCK_POLL_INTERVAL = 0.05
+
+    def __init__(self, name):
+        self.name = name
+
+    def make_key(self, *parts):
+        digest = hashlib.md5(repr(parts).encode()).hexdigest()
+        return f'response:{self.name}:{digest}'
+
+    def stats_key(self, event):
+        return f'response:{self.name}:stats:{event}'
+
+    def count(self, event):
+        key = self.stats_key(event)
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+    def load(self, key):
+        cached = cache.get(key)
+        if cached is None:
+            return None
+        content, content_type = cached
+        response = HttpResponse(content, content_type=content_type)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    def store(self, key, response):
+        cache.set(
+            key, (response.content, response['Content-Type']),
+            settings.RESPONSE_CACHE_TIMEOUT
+        )
+
+    def get_or_render(self, key, render):
+        """ Ответ из кэша или render(), но один на ключ.
+
+        При одновременных промахах рендерит только тот запрос, который
+        взял блокировку в кэше, остальные ждут его результат не дольше
+        RESPONSE_CACHE_LOCK_TIMEOUT и только потом рендерят сами.
+        """
+        response = self.load(key)
+        locked = response is None and self.acquire(key)
+        if response is None and not locked:
+            response, locked = self.wait(key)
+        if response is not None:
+            self.count('hits')
+            return response
+        self.count('misses')
+        try:
+            response = render()
+            if response.status_code == 200:
+                self.store(key, response)
+        finally:
+            if locked:
+                self.release(key)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def acquire(self, key):
+        return cache.add(
+            f'{key}:lock', 1, settings.RESPONSE_CACHE_LOCK_TIMEOUT
+        )
+
+    def release(self, key):
+        cache.delete(f'{key}:lock')
+
+    def wait(self, key):
+        """ Ждёт чужой рендер: (ответ, False) или (None, взята ли
+            блокировка), если ответ так и не появился. """
+        deadline = monotonic() + settings.RESPONSE_CACHE_LOCK_TIMEOUT
+        while monotonic() < deadline:
+            sleep(self.LOCK_POLL_INTERVAL)
+            response = self.load(key)
+            if response is not None:
+                return response, False
+            if self.acquire(key):
+                # Рендерящий запрос завершился без записи в кэш.
+                return None, True
+        return None, False
+
+    def stats(self):
+        keys = [self.stats_key(event) for event in self.EVENTS]
+        values = cache.get_many(keys)
+        return {
+            event: values.get(key, 0)
+            for event, key in zip(self.EVENTS, keys)
+        }
+
+
+catalogue_cache = ResponseCache('catalogue')
+recipes_cache = ResponseCache('recipes')
+
+RESPONSE_CACHES = {
+    response_cache.name: response_cache
+    for response_cache in (catalogue_cache, recipes_cache)
+}
+
+
+class CachedResponseMixin:
+    """ Отдаёт list и retrieve из ResponseCache.
+
+    get_response_cache_stamp возвращает метку данных или None, если
+    запрос нельзя брать из кэша. Кэшируются только ответы 200.
+    """
+
+    response_cache = None
+
+    def get_response_cache_stamp(self):
+        """ Метка данных или None: запрос не берётся из кэша. """
+
+    def get_response_cache_key(self):
+        stamp = self.get_response_cache_stamp()
+        if stamp is None:
+            return None
+        request = self.request
+        return self.response_cache.make_key(
+            stamp, self.basename, self.action, sorted(self.kwargs.items()),
+            sorted(request.query_params.lists()),
+            request.accepted_media_type,
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_response_cache_key()
+        if key is None:
+            return handler(request, *args, **kwargs)
+
+        def render():
+            response = self.finalize_response(
+                request, handler(request, *args, **kwargs), *args, **kwargs
+            )
+            response.render()
+            return response
+
+        return self.response_cache.get_or_render(key, render)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -1,15 +1,47 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
 from django.db.transaction import atomic
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserSerializer
-from drf_base64.fields import Base64ImageField
+from recipes.images import (IMAGE_DECODE_ERRORS, UPLOAD_FORMATS, enqueue_image,
+                            read_image_header)
 from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
-from rest_framework.serializers import (IntegerField, ModelSerializer,
-                                        PrimaryKeyRelatedField,
-                                        SerializerMethodField,
-                                        SlugRelatedField, ValidationError)
+                            ShoppingCart, ShoppingListItem, Tag)
+from rest_framework.serializers import (Field, IntegerField, ModelSerializer,
+                                        PrimaryKeyRelatedField, ReadOnlyField,
+                                        Serializer, SerializerMethodField,
+                                        ValidationError)
 from users.models import Subscription, User
 
+SUBSCRIBED_IDS_ATTR = '_subscribed_author_ids'
+IMAGE_SIZE_PARAM = 'image_size'
+
+
+def get_subscribed_author_ids(request):
+    """ id авторов, на которых подписан пользователь запроса.
+
+    Загружается одним запросом при первом обращении и хранится
+    на объекте запроса до его завершения.
+    """
+    subscribed_ids = getattr(request, SUBSCRIBED_IDS_ATTR, None)
+    if subscribed_ids is None:
+        subscribed_ids = set(Subscription.objects.filter(
+            user=request.user
+        ).values_list('author_id', flat=True))
+        setattr(request, SUBSCRIBED_IDS_ATTR, subscribed_ids)
+    return subscribed_ids
+
+
+def reset_subscribed_author_ids(request):
+    """ Сбрасывает закэшированные подписки после их изменения. """
+    if hasattr(request, SUBSCRIBED_IDS_ATTR):
+        delattr(request, SUBSCRIBED_IDS_ATTR)
+
 
 class CustomUserSerializer(UserSerializer):
     """ Сериализатор пользователя. """
@@ -31,8 +63,7 @@ class CustomUserSerializer(UserSerializer):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        return Subscription.objects.filter(
-            user=request.user, author=obj).exists()
+        return obj.id in get_subscribed_author_ids(request)
 
 
 class TagSerializer(ModelSerializer):
@@ -60,7 +91,104 @@ class IngredientSerializer(ModelSerializer):
         )
 
 
+class RecipeImageField(Field):
+    """ URL картинки рецепта.
+
+    Параметр запроса image_size (thumbnail, card, full) подменяет
+    оригинал JPEG вариантом нужного размера, если он уже создан.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def build_url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        if request is None:
+            return url
+        return request.build_absolute_uri(url)
+
+    def to_representation(self, recipe):
+        if not recipe.image:
+            return None
+        request = self.context.get('request')
+        size = request and request.query_params.get(IMAGE_SIZE_PARAM)
+        variant = recipe.image_variants.get(size, {})
+        return self.build_url(variant.get('jpeg', recipe.image.name))
+
+
+class RecipeImagesField(RecipeImageField):
+    """ URL всех вариантов картинки: {размер: {формат: url}}. """
+
+    def to_representation(self, recipe):
+        return {
+            size: {
+                extension: self.build_url(name)
+                for extension, name in names.items()
+            }
+            for size, names in recipe.image_variants.items()
+        }
+
+
+class ImageUploadField(Field):
+    """ Картинка рецепта: base64 (data:image/<тип>;base64,<данные>)
+        или файл из multipart/form-data.
+
+    Размер файла и размер картинки проверяются по заголовку, без
+    декодирования пикселей. Проверка Pillow целиком, перекодирование
+    и варианты делаются воркером process_image_jobs.
+    """
+
+    default_error_messages = {
+        'invalid': 'Ожидается картинка в base64 или файл.',
+        'format': 'Поддерживаются форматы: {formats}.',
+        'too_large': 'Файл больше {max_bytes} байт.',
+        'dimensions': 'Сторона картинки больше {max_dimension} пикселей.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            image_file = self.decode_base64(data)
+        elif isinstance(data, File):
+            image_file = data
+        else:
+            self.fail('invalid')
+        if image_file.size > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.fail('too_large', max_bytes=settings.RECIPE_IMAGE_MAX_BYTES)
+        try:
+            image_format, size = read_image_header(image_file)
+        except IMAGE_DECODE_ERRORS:
+            self.fail('invalid')
+        if image_format not in UPLOAD_FORMATS:
+            self.fail('format', formats=', '.join(UPLOAD_FORMATS))
+        if max(size) > settings.RECIPE_IMAGE_MAX_DIMENSION:
+            self.fail(
+                'dimensions',
+                max_dimension=settings.RECIPE_IMAGE_MAX_DIMENSION
+            )
+        return image_file
+
+    def decode_base64(self, data):
+        header, _, encoded = data.rpartition('base64,')
+        if header and not header.startswith('data:image/'):
+            self.fail('invalid')
+        # Размер проверяется до декодирования base64.
+        if len(encoded) * 3 // 4 > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.fail('too_large', max_bytes=settings.RECIPE_IMAGE_MAX_BYTES)
+        try:
+            content = base64.b64decode(encoded, validate=True)
+        except (binascii.Error, ValueError):
+            self.fail('invalid')
+        if not content:
+            self.fail('invalid')
+        return ContentFile(content)
+
+
 class RecipeShortSerializer(ModelSerializer):
+    image = RecipeImageField()
+    images = RecipeImagesField()
 
     class Meta:
         model = Recipe
@@ -68,6 +196,7 @@ class RecipeShortSerializer(ModelSerializer):
             'id',
             'name',
             'image',
+            'images',
             'cooking_time'
         )
 
@@ -87,10 +216,18 @@ class SubscriptionsSerializer(ModelSerializer):
         )
 
     def get_recipes_count(self, author):
+        if hasattr(author, 'recipes_count'):
+            return author.recipes_count
         return Recipe.objects.filter(author=author).count()
 
     def get_recipes(self, author):
         queryset = self.context.get('request')
+        if hasattr(author, 'preview_recipes'):
+            return RecipeShortSerializer(
+                author.preview_recipes,
+                many=True,
+                context={'request': queryset}
+            ).data
         recipes_limit = queryset.query_params.get('recipes_limit')
         if recipes_limit:
             return RecipeShortSerializer(
@@ -104,10 +241,11 @@ class SubscriptionsSerializer(ModelSerializer):
         ).data
 
     def get_is_subscribed(self, author):
-        return Subscription.objects.filter(
-            user=self.context.get('request').user,
-            author=author
-        ).exists()
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
+        return author.id in get_subscribed_author_ids(
+            self.context.get('request')
+        )
 
 
 class SubscribeSerializer(ModelSerializer):
@@ -142,20 +280,9 @@ class SubscribeSerializer(ModelSerializer):
 class RecipeIngredientsSerializer(ModelSerializer):
     """ Сериализатор просмотра ингредиента в рецепте. """
 
-    id = PrimaryKeyRelatedField(
-        source='ingredient',
-        read_only=True
-    )
-    measurement_unit = SlugRelatedField(
-        source='ingredient',
-        slug_field='measurement_unit',
-        read_only=True,
-    )
-    name = SlugRelatedField(
-        source='ingredient',
-        slug_field='name',
-        read_only=True,
-    )
+    id = ReadOnlyField(source='ingredient.id')
+    measurement_unit = ReadOnlyField(source='ingredient.measurement_unit')
+    name = ReadOnlyField(source='ingredient.name')
 
     class Meta:
         model = RecipeIngredient
@@ -179,6 +306,8 @@ class RecipeSerializer(ModelSerializer):
     )
     is_favorited = SerializerMethodField(read_only=True)
     is_in_shopping_cart = SerializerMethodField(read_only=True)
+    image = RecipeImageField()
+    images = RecipeImagesField()
 
     class Meta:
         model = Recipe
@@ -191,6 +320,8 @@ class RecipeSerializer(ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
+            'image_status',
             'text',
             'cooking_time'
         ]
@@ -199,6 +330,8 @@ class RecipeSerializer(ModelSerializer):
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return Favourite.objects.filter(
             user=request.user, recipe__id=obj.id
         ).exists()
@@ -207,6 +340,8 @@ class RecipeSerializer(ModelSerializer):
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return ShoppingCart.objects.filter(
             user=request.user, recipe__id=obj.id
         ).exists()
@@ -247,13 +382,12 @@ class CreateIngredientRecipeSerializer(ModelSerializer):
 class RecipeCreateSerializer(ModelSerializer):
     """ Сериализатор создания/обновления рецепта. """
 
-    image = Base64ImageField(use_url=True, max_length=None)
     author = CustomUserSerializer(read_only=True)
     ingredients = CreateIngredientRecipeSerializer(many=True)
     tags = PrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True
     )
-    image = Base64ImageField()
+    image = ImageUploadField()
     cooking_time = IntegerField()
 
     class Meta:
@@ -278,17 +412,37 @@ class RecipeCreateSerializer(ModelSerializer):
             ) for ingredient in ingredients
         ])
 
+    def to_internal_value(self, data):
+        if hasattr(data, 'getlist'):
+            data = self.parse_form_data(data)
+        return super().to_internal_value(data)
+
+    def parse_form_data(self, data):
+        """ multipart/form-data: tags — повторяющееся поле,
+            ingredients — JSON список. """
+        values = {key: data.get(key) for key in data}
+        if 'tags' in data:
+            values['tags'] = data.getlist('tags')
+        if 'ingredients' in data:
+            try:
+                values['ingredients'] = json.loads(data['ingredients'])
+            except ValueError:
+                raise ValidationError({
+                    'ingredients': ['Ожидается JSON список ингредиентов.']
+                })
+        return values
+
     def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
+        ingredients = data.get('ingredients', [])
         ingredients_list = []
         for ingredient in ingredients:
-            ingredient_id = ingredient['id']
+            ingredient_id = ingredient['ingredient'].id
             if ingredient_id in ingredients_list:
                 raise ValidationError(
                     'Есть задублированные ингредиенты!'
                 )
             ingredients_list.append(ingredient_id)
-        if data['cooking_time'] <= 0:
+        if data.get('cooking_time', 1) <= 0:
             raise ValidationError(
                 'Время приготовления должно быть больше 0!'
             )
@@ -299,31 +453,114 @@ class RecipeCreateSerializer(ModelSerializer):
         request = self.context.get('request')
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
+        image = validated_data.pop('image')
         recipe = Recipe.objects.create(
             author=request.user,
             **validated_data
         )
         self.create_ingredients(recipe, ingredients)
         recipe.tags.set(tags)
+        Recipe.objects.filter(pk=recipe.pk).update_search_vector()
+        enqueue_image(recipe, image)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """ Приводит ингредиенты рецепта к ingredients без пересоздания
+            строк: новые добавляются, изменённые количества обновляются
+            одним запросом, лишние удаляются. Возвращает id добавленных
+            и удалённых ингредиентов и id ингредиентов с новым
+            количеством. """
+        amounts = {
+            ingredient['ingredient'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        existing = {
+            item.ingredient_id: item
+            for item in recipe.ingridients_recipe.all()
+        }
+        removed = existing.keys() - amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(pk__in=[
+                existing[ingredient_id].pk for ingredient_id in removed
+            ]).delete()
+        changed = [
+            item for ingredient_id, item in existing.items()
+            if ingredient_id in amounts
+            and item.amount != amounts[ingredient_id]
+        ]
+        for item in changed:
+            item.amount = amounts[item.ingredient_id]
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        added = [
+            ingredient for ingredient in ingredients
+            if ingredient['ingredient'].id not in existing
+        ]
+        self.create_ingredients(recipe, added)
+        return (
+            removed | {ingredient['ingredient'].id for ingredient in added},
+            {item.ingredient_id for item in changed},
+        )
+
     @atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
+        # В PATCH ингредиенты и теги можно не передавать: тогда они
+        # остаются как есть.
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        image = validated_data.pop('image', None)
         recipe = instance
-        RecipeIngredient.objects.filter(recipe=recipe).delete()
-        self.create_ingredients(recipe, ingredients)
-        return super().update(recipe, validated_data)
+        text_changed = any(
+            field in validated_data
+            and validated_data[field] != getattr(recipe, field)
+            for field in ('name', 'text')
+        )
+        replaced = set()
+        if ingredients is not None:
+            with ShoppingListItem.objects.deferred_refresh() as pending:
+                replaced, changed = self.update_ingredients(
+                    recipe, ingredients
+                )
+                # bulk_create и bulk_update не посылают сигналов.
+                if replaced or changed:
+                    pending.add(ingredients=replaced | changed,
+                                cart_recipes=[recipe.pk])
+        if tags is not None:
+            recipe.tags.set(tags)
+        recipe = super().update(recipe, validated_data)
+        if text_changed or replaced:
+            Recipe.objects.filter(pk=recipe.pk).update_search_vector()
+        if image is not None:
+            enqueue_image(recipe, image)
+        return recipe
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = Recipe.objects.with_related().with_user_flags(
+            request.user
+        ).get(pk=instance.pk)
         return RecipeSerializer(
             instance,
             context={
-                'request': self.context.get('request'),
+                'request': request,
             }
         ).data
 
 
+class RecipeImageUploadSerializer(Serializer):
+    """ Замена картинки рецепта отдельным запросом. """
+
+    image = ImageUploadField()
+
+    def update(self, instance, validated_data):
+        enqueue_image(instance, validated_data['image'])
+        return instance
+
+    def to_representation(self, instance):
+        return RecipeCreateSerializer(
+            instance, context=self.context
+        ).to_representation(instance)
+
+
 class ShoppingCartSerializer(ModelSerializer):
     """ Сериализатор для списка покупок. """
 
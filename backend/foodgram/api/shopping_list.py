@@ -0,0 +1,361 @@
+import csv
+import hashlib
+import io
+import os
+import textwrap
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Таблицы, которые не нужны встроенному в PDF шрифту: глифы выбирает
+# сам StreamingPDF, без OpenType лэйаута.
+FONT_DROP_TABLES = ('GSUB', 'GPOS', 'GDEF', 'kern', 'MATH', 'FFTM')
+
+FontMetrics = namedtuple(
+    'FontMetrics',
+    'name cmap widths units_per_em bbox ascent descent'
+)
+
+
+def shopping_list_lines(ingredients):
+    for ingredient in ingredients:
+        yield (
+            f'- {ingredient["ingredient__name"]} '
+            f'({ingredient["ingredient__measurement_unit"]})'
+            f' - {ingredient["amount"]}'
+        )
+
+
+def render_txt(user, ingredients, today):
+    """ Список покупок в виде текста. """
+    yield (
+        f'Список покупок для: {user.get_full_name()}\n\n'
+        f'Дата: {today:%Y-%m-%d}\n\n'
+    )
+    separator = ''
+    for line in shopping_list_lines(ingredients):
+        yield separator + line
+        separator = '\n'
+    yield f'\n\nFoodgram ({today:%Y})'
+
+
+class Echo:
+    """ Буфер для csv.writer, который сразу возвращает строку. """
+
+    def write(self, value):
+        return value
+
+
+def render_csv(user, ingredients, today):
+    """ Список покупок в виде CSV. """
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount'],
+        ))
+
+
+@lru_cache(maxsize=None)
+def load_font(path):
+    """ Метрики TrueType шрифта, нужные для встраивания в PDF. """
+    from fontTools.ttLib import TTFont
+
+    if not os.path.exists(path):
+        raise ImproperlyConfigured(
+            f'Шрифт для PDF не найден: {path}. '
+            'Проверьте настройку SHOPPING_LIST_PDF_FONT.'
+        )
+    font = TTFont(path)
+    glyph_ids = {
+        name: glyph_id for glyph_id, name in enumerate(font.getGlyphOrder())
+    }
+    units_per_em = font['head'].unitsPerEm
+    name = font['name'].getDebugName(6) or 'Font'
+    return FontMetrics(
+        name=''.join(char for char in name if char.isalnum() or char == '-'),
+        cmap={
+            code: glyph_ids[glyph]
+            for code, glyph in font.getBestCmap().items()
+        },
+        widths={
+            glyph_ids[glyph]: metrics[0]
+            for glyph, metrics in font['hmtx'].metrics.items()
+        },
+        units_per_em=units_per_em,
+        bbox=(
+            font['head'].xMin, font['head'].yMin,
+            font['head'].xMax, font['head'].yMax,
+        ),
+        ascent=font['hhea'].ascent,
+        descent=font['hhea'].descent,
+    )
+
+
+@lru_cache(maxsize=None)
+def read_font(path):
+    with open(path, 'rb') as font_file:
+        return font_file.read()
+
+
+def subset_font(path, glyph_ids):
+    """ Шрифт только с контурами glyph_ids.
+
+    Номера глифов сохраняются (retain_gids), поэтому текст страниц,
+    записанный до подмножества, и CIDToGIDMap /Identity остаются
+    верными, а контуры остальных глифов пустые.
+    """
+    from fontTools.subset import Options, Subsetter
+    from fontTools.ttLib import TTFont
+
+    options = Options()
+    options.retain_gids = True
+    options.notdef_outline = True
+    options.hinting = False
+    options.drop_tables += FONT_DROP_TABLES
+    font = TTFont(io.BytesIO(read_font(path)))
+    subsetter = Subsetter(options)
+    subsetter.populate(gids=glyph_ids)
+    subsetter.subset(font)
+    data = io.BytesIO()
+    font.save(data)
+    return data.getvalue()
+
+
+class StreamingPDF:
+    """ PDF, который отдаётся клиенту постранично.
+
+    Каждая страница записывается в поток, как только набрана, а шрифт,
+    дерево страниц и таблица xref дописываются в конце документа.
+    В памяти держится только текущая страница. Встраивается только
+    подмножество шрифта с глифами, которые встретились в тексте.
+    """
+
+    PAGE_WIDTH = 595
+    PAGE_HEIGHT = 842
+    MARGIN = 50
+    FONT_SIZE = 11
+    LEADING = 16
+    LINE_WIDTH = 80
+
+    CATALOG = 1
+    PAGES = 2
+    FONT = 3
+    CID_FONT = 4
+    FONT_DESCRIPTOR = 5
+    FONT_FILE = 6
+    TO_UNICODE = 7
+
+    def __init__(self, font_path):
+        self.font_path = font_path
+        self.font = load_font(font_path)
+        self.used_glyphs = {}
+        self.offsets = {}
+        self.position = 0
+        self.next_id = self.TO_UNICODE + 1
+        self.page_ids = []
+        self.lines_per_page = (
+            (self.PAGE_HEIGHT - 2 * self.MARGIN) // self.LEADING
+        )
+
+    def write(self, data):
+        self.position += len(data)
+        return data
+
+    def write_object(self, number, body):
+        self.offsets[number] = self.position
+        return self.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def reserve_id(self):
+        number = self.next_id
+        self.next_id += 1
+        return number
+
+    def encode(self, text):
+        glyphs = []
+        for char in text:
+            glyph_id = self.font.cmap.get(ord(char), 0)
+            if glyph_id:
+                self.used_glyphs.setdefault(glyph_id, char)
+            glyphs.append(b'%04X' % glyph_id)
+        return b''.join(glyphs)
+
+    def render(self, lines):
+        yield self.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        page = []
+        for line in lines:
+            for part in textwrap.wrap(line, self.LINE_WIDTH) or ['']:
+                page.append(part)
+                if len(page) == self.lines_per_page:
+                    yield from self.render_page(page)
+                    page = []
+        if page or not self.page_ids:
+            yield from self.render_page(page)
+        yield from self.render_font()
+        yield from self.render_trailer()
+
+    def render_page(self, lines):
+        content = b''.join(
+            [
+                b'BT\n/F1 %d Tf\n%d TL\n%d %d Td\n' % (
+                    self.FONT_SIZE, self.LEADING, self.MARGIN,
+                    self.PAGE_HEIGHT - self.MARGIN - self.FONT_SIZE,
+                )
+            ]
+            + [b'<%s> Tj T*\n' % self.encode(line) for line in lines]
+            + [b'ET']
+        )
+        content_id = self.reserve_id()
+        page_id = self.reserve_id()
+        self.page_ids.append(page_id)
+        yield self.write_object(
+            content_id,
+            b'<< /Length %d >>\nstream\n%s\nendstream' % (
+                len(content), content
+            )
+        )
+        yield self.write_object(
+            page_id,
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] '
+            b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>' % (
+                self.PAGES, self.PAGE_WIDTH, self.PAGE_HEIGHT,
+                self.FONT, content_id,
+            )
+        )
+
+    def scale(self, value):
+        return round(value * 1000 / self.font.units_per_em)
+
+    def subset_tag(self):
+        """ Префикс имени подмножества шрифта: шесть заглавных букв. """
+        digest = hashlib.md5(
+            repr(sorted(self.used_glyphs)).encode()
+        ).digest()
+        return ''.join(chr(ord('A') + byte % 26) for byte in digest[:6])
+
+    def render_font(self):
+        name = f'{self.subset_tag()}+{self.font.name}'.encode()
+        yield self.write_object(
+            self.FONT,
+            b'<< /Type /Font /Subtype /Type0 /BaseFont /%s '
+            b'/Encoding /Identity-H /DescendantFonts [%d 0 R] '
+            b'/ToUnicode %d 0 R >>' % (name, self.CID_FONT, self.TO_UNICODE)
+        )
+        widths = b' '.join(
+            b'%d [%d]' % (
+                glyph_id, self.scale(self.font.widths.get(glyph_id, 0))
+            )
+            for glyph_id in sorted(self.used_glyphs)
+        )
+        yield self.write_object(
+            self.CID_FONT,
+            b'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /%s '
+            b'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) '
+            b'/Supplement 0 >> /FontDescriptor %d 0 R /W [%s] '
+            b'/CIDToGIDMap /Identity >>' % (
+                name, self.FONT_DESCRIPTOR, widths
+            )
+        )
+        yield self.write_object(
+            self.FONT_DESCRIPTOR,
+            b'<< /Type /FontDescriptor /FontName /%s /Flags 32 '
+            b'/FontBBox [%d %d %d %d] /ItalicAngle 0 /Ascent %d '
+            b'/Descent %d /CapHeight %d /StemV 80 /FontFile2 %d 0 R >>' % (
+                name, *(self.scale(value) for value in self.font.bbox),
+                self.scale(self.font.ascent), self.scale(self.font.descent),
+                self.scale(self.font.ascent), self.FONT_FILE,
+            )
+        )
+        yield from self.render_font_file()
+        yield from self.render_to_unicode()
+
+    def render_font_file(self):
+        data = subset_font(self.font_path, sorted(self.used_glyphs))
+        yield self.write_object(
+            self.FONT_FILE,
+            b'<< /Length %d /Length1 %d >>\nstream\n%s\nendstream' % (
+                len(data), len(data), data
+            )
+        )
+
+    def render_to_unicode(self):
+        mapping = sorted(self.used_glyphs.items())
+        blocks = []
+        for start in range(0, len(mapping), 100):
+            block = mapping[start:start + 100]
+            blocks.append(b'%d beginbfchar\n%s\nendbfchar' % (
+                len(block),
+                b'\n'.join(
+                    b'<%04X> <%s>' % (
+                        glyph_id, char.encode('utf-16-be').hex().encode()
+                    )
+                    for glyph_id, char in block
+                )
+            ))
+        cmap = (
+            b'/CIDInit /ProcSet findresource begin\n12 dict begin\n'
+            b'begincmap\n/CIDSystemInfo << /Registry (Adobe) '
+            b'/Ordering (UCS) /Supplement 0 >> def\n'
+            b'/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+            b'1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n'
+            + b'\n'.join(blocks)
+            + b'\nendcmap\nCMapName currentdict /CMap defineresource pop\n'
+            b'end\nend'
+        )
+        yield self.write_object(
+            self.TO_UNICODE,
+            b'<< /Length %d >>\nstream\n%s\nendstream' % (len(cmap), cmap)
+        )
+
+    def render_trailer(self):
+        yield self.write_object(
+            self.PAGES,
+            b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+                b' '.join(b'%d 0 R' % page for page in self.page_ids),
+                len(self.page_ids),
+            )
+        )
+        yield self.write_object(
+            self.CATALOG,
+            b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES
+        )
+        xref_position = self.position
+        size = self.next_id
+        yield self.write(
+            b'xref\n0 %d\n0000000000 65535 f \n' % size
+            + b''.join(
+                b'%010d 00000 n \n' % self.offsets[number]
+                for number in range(1, size)
+            )
+            + b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+            % (size, self.CATALOG, xref_position)
+        )
+
+
+def render_pdf(user, ingredients, today):
+    """ Список покупок в виде PDF, страница за страницей. """
+    header = [
+        f'Список покупок для: {user.get_full_name()}',
+        '',
+        f'Дата: {today:%Y-%m-%d}',
+        '',
+    ]
+    footer = ['', f'Foodgram ({today:%Y})']
+
+    def lines():
+        yield from header
+        yield from shopping_list_lines(ingredients)
+        yield from footer
+
+    return StreamingPDF(settings.SHOPPING_LIST_PDF_FONT).render(lines())
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain', render_txt),
+    'csv': ('text/csv', render_csv),
+    'pdf': ('application/pdf', render_pdf),
+}
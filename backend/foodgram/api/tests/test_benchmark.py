@@ -0,0 +1,29 @@
+import io
+import json
+
+from api.management.commands.benchmark_api import ENDPOINTS
+from django.core.management import call_command
+from django.test import LiveServerTestCase
+from recipes.seed import seed_database
+
+
+class BenchmarkApiTest(LiveServerTestCase):
+    """ Нагрузочный тест против запущенного сервера. """
+
+    def test_report(self):
+        seed_database(users=10, recipes=30, favourites=50, carts=20,
+                      subscriptions=20)
+        stdout = io.StringIO()
+        call_command(
+            'benchmark_api', '--url', self.live_server_url,
+            '--concurrency', '1', '--requests', '5', '--warmup', '1',
+            stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report['rows']['recipes'], 30)
+        self.assertEqual(
+            list(report['endpoints']), [name for name, _ in ENDPOINTS])
+        for name, endpoint in report['endpoints'].items():
+            self.assertEqual(endpoint['requests'], 5, name)
+            self.assertEqual(endpoint['errors'], 0, name)
+            self.assertLessEqual(
+                endpoint['p50_ms'], endpoint['p99_ms'], name)
@@ -0,0 +1,75 @@
+from django.test import TestCase
+from recipes.models import Favourite, Recipe, Tag
+from rest_framework.test import APIClient
+from users.models import User
+
+RECIPES_URL = '/api/recipes/'
+TAGS_URL = '/api/tags/'
+
+
+class ConditionalGetTest(TestCase):
+    """ ETag и 304 для рецептов и справочников. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass')
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            cooking_time=10)
+        Tag.objects.create(name='Завтрак', color='#00FA9A', slug='breakfast')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def etag(self, url, client=None):
+        response = (client or self.client).get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertIn('Last-Modified', response)
+        return response['ETag']
+
+    def test_not_modified_without_queries(self):
+        for url in (RECIPES_URL, TAGS_URL, '/api/ingredients/'):
+            etag = self.etag(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_detail(self):
+        url = f'{RECIPES_URL}{self.recipe.id}/'
+        etag = self.etag(url)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Новое название'
+            self.recipe.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Новое название')
+
+    def test_feed_changes_with_recipes(self):
+        etag = self.etag(RECIPES_URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertNotEqual(self.etag(RECIPES_URL), etag)
+
+    def test_user_state_changes_etag(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        etag = self.etag(RECIPES_URL, client)
+        self.assertNotEqual(etag, self.etag(RECIPES_URL))
+        with self.captureOnCommitCallbacks(execute=True):
+            Favourite.objects.create(user=self.user, recipe=self.recipe)
+        self.assertNotEqual(self.etag(RECIPES_URL, client), etag)
+
+    def test_catalogue_changes_etag(self):
+        etag = self.etag(TAGS_URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Обед', color='#FF0000', slug='lunch')
+        response = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
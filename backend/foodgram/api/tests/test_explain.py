@@ -0,0 +1,34 @@
+import io
+import json
+import os
+import tempfile
+
+from api.management.commands.explain_endpoints import ENDPOINTS
+from django.core.management import call_command
+from django.test import TestCase
+
+
+class ExplainEndpointsTest(TestCase):
+    """ Планы запросов эндпоинтов на заполненной базе. """
+
+    def test_plans_recorded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'plans.json')
+            stdout = io.StringIO()
+            call_command(
+                'explain_endpoints', '--seed-scale', '1',
+                '--output', output, stdout=stdout)
+            with open(output, encoding='utf-8') as file:
+                report = json.load(file)
+            call_command(
+                'explain_endpoints', '--compare', output,
+                stdout=stdout)
+        self.assertEqual(report['recipes'], 500)
+        self.assertEqual(
+            list(report['endpoints']), [name for name, _ in ENDPOINTS])
+        for name, endpoint in report['endpoints'].items():
+            self.assertEqual(endpoint['status'], 200, name)
+            self.assertTrue(endpoint['queries'], name)
+            for query in endpoint['queries']:
+                self.assertTrue(query['plan'], query['sql'])
+        self.assertNotIn('было:', stdout.getvalue())
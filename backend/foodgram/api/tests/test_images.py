@@ -0,0 +1,335 @@
+import base64
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from recipes.images import delete_orphan_images
+from recipes.models import (ImageJob, ImageStatus, Ingredient, Recipe,
+                            StoredImage, Tag)
+from rest_framework.test import APIClient
+from users.models import User
+
+from .test_recipes import IMAGE
+
+MEDIA_ROOT = tempfile.mkdtemp()
+UPLOAD_ROOT = tempfile.mkdtemp()
+RECIPES_URL = '/api/recipes/'
+
+
+def image_file(size=(2000, 1000), image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 100, 50)).save(buffer, image_format)
+    return ContentFile(buffer.getvalue(), name='photo.png')
+
+
+def process_jobs():
+    call_command('process_image_jobs', '--once', stdout=io.StringIO())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_UPLOAD_ROOT=UPLOAD_ROOT)
+class ImageVariantsTest(TestCase):
+    """ Варианты картинки рецепта разных размеров. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass')
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#00FA9A', slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='абрикосы', measurement_unit='г')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(UPLOAD_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def assert_variants(self, variants):
+        self.assertEqual(set(variants), set(settings.RECIPE_IMAGE_VARIANTS))
+        for size, box in settings.RECIPE_IMAGE_VARIANTS.items():
+            self.assertEqual(set(variants[size]), {'webp', 'jpeg'})
+            for name in variants[size].values():
+                with Image.open(os.path.join(MEDIA_ROOT, name)) as image:
+                    self.assertLessEqual(image.width, box[0])
+                    self.assertLessEqual(image.height, box[1])
+
+    def post_recipe(self, image=IMAGE):
+        response = self.client.post(RECIPES_URL, {
+            'name': 'Пирог',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 5}],
+            'image': image,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response
+
+    def test_processed_by_worker(self):
+        response = self.post_recipe()
+        self.assertEqual(response.data['image_status'], ImageStatus.PENDING)
+        self.assertIsNone(response.data['image'])
+        upload = ImageJob.objects.get().upload.path
+        self.assertTrue(os.path.exists(upload))
+        process_jobs()
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        self.assertEqual(recipe.image_status, ImageStatus.READY)
+        self.assert_variants(recipe.image_variants)
+        self.assertFalse(os.path.exists(upload))
+        response = self.client.get(f'{RECIPES_URL}{recipe.id}/')
+        self.assertTrue(response.data['images']['thumbnail']['webp']
+                        .endswith('_thumbnail.webp'))
+
+    def test_invalid_image(self):
+        content = base64.b64encode(b'<html></html>').decode()
+        response = self.client.post(RECIPES_URL, {
+            'name': 'Пирог',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 5}],
+            'image': f'data:image/png;base64,{content}',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+
+    def test_broken_image_fails_in_worker(self):
+        content = base64.b64encode(image_file().read()[:80]).decode()
+        response = self.post_recipe(f'data:image/png;base64,{content}')
+        process_jobs()
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        self.assertEqual(recipe.image_status, ImageStatus.FAILED)
+        self.assertFalse(recipe.image)
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.FAILED)
+
+    def test_not_base64(self):
+        response = self.client.post(RECIPES_URL, {
+            'name': 'Пирог',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 5}],
+            'image': 'data:image/png;base64,!!!',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+
+    def test_only_latest_upload(self):
+        recipe_id = self.post_recipe().data['id']
+        response = self.client.patch(f'{RECIPES_URL}{recipe_id}/', {
+            'name': 'Пирог',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 5}],
+            'image': IMAGE,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(ImageJob.objects.count(), 1)
+        process_jobs()
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe_id).image_status, ImageStatus.READY)
+
+    def test_size_hint(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Пирог', text='Описание',
+            cooking_time=10, image=image_file())
+        call_command('build_image_variants', '--workers', '1',
+                     stdout=io.StringIO())
+        url = f'{RECIPES_URL}{recipe.id}/'
+        original = self.client.get(url).data['image']
+        self.assertTrue(original.endswith('.png'))
+        card = self.client.get(url, {'image_size': 'card'}).data['image']
+        self.assertTrue(card.endswith('_card.jpeg'))
+
+    def test_backfill_command(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Пирог', text='Описание',
+            cooking_time=10, image=image_file())
+        broken = Recipe.objects.create(
+            author=self.author, name='Суп', text='Описание',
+            cooking_time=10, image='recipes/images/missing.png')
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('build_image_variants', '--workers', '1',
+                     stdout=stdout, stderr=stderr)
+        recipe.refresh_from_db()
+        broken.refresh_from_db()
+        self.assert_variants(recipe.image_variants)
+        self.assertEqual(broken.image_variants, {})
+        self.assertIn('missing.png', stderr.getvalue())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_UPLOAD_ROOT=UPLOAD_ROOT)
+class MultipartUploadTest(TestCase):
+    """ Загрузка картинки рецепта через multipart/form-data. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass')
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#00FA9A', slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='абрикосы', measurement_unit='г')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Пирог', text='Описание',
+            cooking_time=10)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def upload(self, size=(300, 200)):
+        return SimpleUploadedFile(
+            'photo.png', image_file(size).read(), content_type='image/png')
+
+    def test_create(self):
+        response = self.client.post(RECIPES_URL, {
+            'name': 'Суп',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [self.tag.id],
+            'ingredients': (
+                f'[{{"id": {self.ingredient.id}, "amount": 5}}]'
+            ),
+            'image': self.upload(),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['image_status'], ImageStatus.PENDING)
+        self.assertEqual(response.data['ingredients'][0]['amount'], 5)
+        self.assertEqual(response.data['tags'][0]['id'], self.tag.id)
+
+    def test_image_resource(self):
+        url = f'{RECIPES_URL}{self.recipe.id}/image/'
+        response = self.client.put(
+            url, {'image': self.upload()}, format='multipart')
+        self.assertEqual(response.status_code, 202, response.data)
+        process_jobs()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_status, ImageStatus.READY)
+        self.assertTrue(self.recipe.image.name.endswith('.png'))
+
+    def test_image_resource_raw_body(self):
+        response = self.client.put(
+            f'{RECIPES_URL}{self.recipe.id}/image/',
+            image_file().read(), content_type='image/png',
+            HTTP_CONTENT_DISPOSITION='attachment; filename=photo.png')
+        self.assertEqual(response.status_code, 202, response.data)
+
+    def test_image_resource_author_only(self):
+        other = User.objects.create_user(
+            username='other', email='other@foodgram.ru', password='pass')
+        self.client.force_authenticate(other)
+        response = self.client.put(
+            f'{RECIPES_URL}{self.recipe.id}/image/',
+            {'image': self.upload()}, format='multipart')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(RECIPE_IMAGE_MAX_BYTES=1024)
+    def test_too_large(self):
+        response = self.client.put(
+            f'{RECIPES_URL}{self.recipe.id}/image/',
+            {'image': SimpleUploadedFile('photo.png', b'0' * 200_000)},
+            format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1024', str(response.data['image']))
+        self.assertFalse(ImageJob.objects.exists())
+
+    @override_settings(RECIPE_IMAGE_MAX_DIMENSION=100)
+    def test_too_big_dimensions(self):
+        response = self.client.put(
+            f'{RECIPES_URL}{self.recipe.id}/image/',
+            {'image': self.upload((20_000, 10))}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('100', str(response.data['image']))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_UPLOAD_ROOT=UPLOAD_ROOT)
+class StoredImageTest(TestCase):
+    """ Хранение картинок по хешу содержимого и учёт ссылок. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=name, text='Описание',
+                cooking_time=10)
+            for name in ('Пирог', 'Суп')
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def upload(self, recipe, size=(300, 200)):
+        response = self.client.put(
+            f'{RECIPES_URL}{recipe.id}/image/',
+            {'image': SimpleUploadedFile(
+                'photo.png', image_file(size).read())},
+            format='multipart')
+        self.assertEqual(response.status_code, 202, response.data)
+        process_jobs()
+        recipe.refresh_from_db()
+        return recipe.image.name
+
+    def files(self, stored):
+        names = {stored.name} | {
+            name for names in stored.variants.values()
+            for name in names.values()
+        }
+        return [os.path.join(MEDIA_ROOT, name) for name in names]
+
+    def test_same_image_stored_once(self):
+        first = self.upload(self.recipes[0])
+        second = self.upload(self.recipes[1])
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^recipes/images/[0-9a-f]{2}/[0-9a-f]{62}'
+                                r'\.png$')
+        stored = StoredImage.objects.get(name=first)
+        self.assertEqual(stored.references, 2)
+        self.assertEqual(
+            self.recipes[1].image_variants, self.recipes[0].image_variants)
+
+    def test_orphans_deleted(self):
+        old = self.upload(self.recipes[0])
+        self.upload(self.recipes[1])
+        self.upload(self.recipes[0], size=(200, 300))
+        self.recipes[1].delete()
+        stored = StoredImage.objects.get(name=old)
+        self.assertEqual(stored.references, 0)
+        self.assertEqual(delete_orphan_images(timedelta(hours=1)), 0)
+        self.assertEqual(delete_orphan_images(timedelta()), 1)
+        self.assertFalse(StoredImage.objects.filter(name=old).exists())
+        for path in self.files(stored):
+            self.assertFalse(os.path.exists(path))
+        current = StoredImage.objects.get()
+        self.assertEqual(current.name, self.recipes[0].image.name)
+        for path in self.files(current):
+            self.assertTrue(os.path.exists(path))
+
+    def test_model_save_counts_references(self):
+        recipe = self.recipes[0]
+        recipe.image = image_file()
+        recipe.save()
+        name = recipe.image.name
+        self.assertEqual(StoredImage.objects.get(name=name).references, 1)
+        recipe.image = image_file((100, 100))
+        recipe.save()
+        self.assertEqual(StoredImage.objects.get(name=name).references, 0)
+        self.assertEqual(
+            StoredImage.objects.get(name=recipe.image.name).references, 1)
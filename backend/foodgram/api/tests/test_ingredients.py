@@ -0,0 +1,147 @@
+import io
+import os
+import tempfile
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from recipes.models import Ingredient, Tag
+from recipes.search import get_ingredients_version, search_ingredients
+from rest_framework.test import APIClient
+
+INGREDIENTS_URL = '/api/ingredients/'
+
+
+class IngredientSearchTest(TestCase):
+    """ Поиск ингредиентов по имени. """
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create([
+            Ingredient(name=name, measurement_unit='г')
+            for name in (
+                'абрикосы', 'абрикосовый джем', 'авокадо', 'морковь',
+                'морская соль', 'соль', 'соль морская',
+            )
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def search(self, name):
+        response = self.client.get(INGREDIENTS_URL, {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_prefix_then_substring(self):
+        self.assertEqual(
+            self.search('соль'),
+            ['соль', 'соль морская', 'морская соль']
+        )
+        self.assertEqual(self.search('кос'),
+                         ['абрикосовый джем', 'абрикосы'])
+
+    def test_case_insensitive(self):
+        self.assertEqual(self.search('АБРИКОС'),
+                         ['абрикосовый джем', 'абрикосы'])
+
+    def test_index_matches_database(self):
+        for name in ('а', 'абр', 'мор', 'соль', 'оль м', 'я'):
+            index_response = self.client.get(INGREDIENTS_URL, {'name': name})
+            with override_settings(INGREDIENT_SEARCH_INDEX=False):
+                database_response = self.client.get(
+                    INGREDIENTS_URL, {'name': name})
+            self.assertEqual(index_response.json(), database_response.json())
+
+    def test_no_limit_by_default(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'соль {number:03d}', measurement_unit='г')
+            for number in range(100)
+        )
+        self.assertEqual(len(self.search('соль')), 103)
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=2)
+    def test_limit(self):
+        self.assertEqual(self.search('соль'), ['соль', 'соль морская'])
+        self.assertEqual(self.search('мор'), ['морковь', 'морская соль'])
+        self.assertEqual(self.search('оль'),
+                         ['морская соль', 'соль'])
+        for name in ('а', 'мор', 'оль'):
+            index_response = self.client.get(INGREDIENTS_URL, {'name': name})
+            with override_settings(INGREDIENT_SEARCH_INDEX=False):
+                database_response = self.client.get(
+                    INGREDIENTS_URL, {'name': name})
+            self.assertEqual(index_response.json(), database_response.json())
+
+    def test_refreshed_after_change(self):
+        self.search('а')
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient = Ingredient.objects.create(
+                name='ананас', measurement_unit='шт.')
+        response = self.client.get(INGREDIENTS_URL, {'name': 'ана'})
+        self.assertEqual(response.json(), [{
+            'id': ingredient.id,
+            'name': 'ананас',
+            'measurement_unit': 'шт.',
+        }])
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.delete()
+        self.assertEqual(self.search('ана'), [])
+
+    def test_version_bumped_on_commit(self):
+        version = get_ingredients_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Ingredient.objects.create(name='ананас', measurement_unit='шт.')
+            self.assertEqual(get_ingredients_version(), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_ingredients_version(), version)
+
+
+class LoadIngredientsTest(TestCase):
+    """ Загрузка справочника командой load_ingredients. """
+
+    def test_repeated_in_one_transaction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ingredients = os.path.join(directory, 'ingredients.csv')
+            tags = os.path.join(directory, 'tag.csv')
+            with open(ingredients, 'w', encoding='utf-8') as f:
+                f.write('соль,г\nсахар,г\nсоль,г\n')
+            with open(tags, 'w', encoding='utf-8') as f:
+                f.write('Завтрак,#E26C2D,breakfast\n')
+            for _ in range(2):
+                call_command('load_ingredients', ingredients=ingredients,
+                             tags=tags, stdout=io.StringIO())
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('name', flat=True)),
+            ['сахар', 'соль']
+        )
+        self.assertEqual(Tag.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Только для PostgreSQL')
+class IngredientSearchPlanTest(TestCase):
+    """ Поиск ингредиентов в БД использует индекс. """
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=f'ингредиент {number:06d}',
+                           measurement_unit='г')
+                for number in range(100_000)
+            ),
+            batch_size=10_000
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE recipes_ingredient')
+
+    def test_index_scan(self):
+        plan = search_ingredients(
+            Ingredient.objects.all(), 'диент 0421'
+        ).explain()
+        self.assertIn('recipes_ingredient_name_upper_trgm', plan)
+        self.assertNotIn('Seq Scan', plan)
@@ -0,0 +1,177 @@
+import json
+import os
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, Tag)
+from rest_framework.test import APIClient
+from users.models import Subscription, User
+
+# Бюджеты запросов лежат в репозитории: любое их изменение видно
+# в ревью. Пересчитать бюджеты для текущей СУБД:
+# UPDATE_QUERY_BUDGETS=1 manage.py test api.tests.test_query_budgets
+BUDGETS_FILE = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+PAGE_SIZES = (6, 60)
+
+# (имя, путь, параметры, постраничный ли ответ). В пути подставляются
+# id из setUpTestData.
+ANONYMOUS = (
+    ('recipes', '/api/recipes/', {}, True),
+    ('recipes_by_tag', '/api/recipes/', {'tags': 'tag0'}, True),
+    ('recipes_by_author', '/api/recipes/', {'author': '{author}'}, True),
+    ('recipe', '/api/recipes/{recipe}/', {}, False),
+    ('users', '/api/users/', {}, True),
+    ('tags', '/api/tags/', {}, False),
+    ('tag', '/api/tags/{tag}/', {}, False),
+    ('ingredients', '/api/ingredients/', {'name': 'ингр'}, False),
+    ('ingredient', '/api/ingredients/{ingredient}/', {}, False),
+)
+AUTHENTICATED = (
+    ('recipes', '/api/recipes/', {}, True),
+    ('recipes_favorited', '/api/recipes/', {'is_favorited': 1}, True),
+    ('recipes_in_cart', '/api/recipes/', {'is_in_shopping_cart': 1}, True),
+    ('recipes_by_author', '/api/recipes/', {'author': '{author}'}, True),
+    ('recipe', '/api/recipes/{recipe}/', {}, False),
+    ('subscriptions', '/api/users/subscriptions/', {'recipes_limit': 3},
+     True),
+    ('users', '/api/users/', {}, True),
+    ('user', '/api/users/{author}/', {}, False),
+    ('me', '/api/users/me/', {}, False),
+    ('download_shopping_cart', '/api/recipes/download_shopping_cart/', {},
+     False),
+)
+
+
+class QueryBudgetTest(TestCase):
+    """ Число SQL-запросов эндпоинтов по бюджетам из query_budgets.json.
+
+    Постраничные эндпоинты проверяются при limit=6 и limit=60: число
+    запросов не должно зависеть от размера страницы.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass')
+        User.objects.bulk_create(
+            User(username=f'author{number}',
+                 email=f'author{number}@foodgram.ru')
+            for number in range(70)
+        )
+        authors = list(User.objects.filter(username__startswith='author'))
+        cls.author = authors[0]
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', color='#00FA9A', slug=f'tag{number}')
+            for number in range(3)
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(10)
+        )
+        Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {number}',
+                   text='Описание', cooking_time=10)
+            for number, author in enumerate(authors[:1] * 60 + authors)
+        )
+        recipes = list(Recipe.objects.all())
+        tags = list(Tag.objects.all())
+        ingredients = list(Ingredient.objects.all())
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes for tag in tags
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=5)
+            for recipe in recipes for ingredient in ingredients[:5]
+        )
+        for model in (Favourite, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=cls.reader, recipe=recipe) for recipe in recipes
+            )
+        ShoppingListItem.objects.refresh([cls.reader.id], ingredients)
+        Subscription.objects.bulk_create(
+            Subscription(user=cls.reader, author=author)
+            for author in authors
+        )
+        cls.ids = {
+            'author': cls.author.id,
+            'recipe': recipes[0].id,
+            'tag': tags[0].id,
+            'ingredient': ingredients[0].id,
+        }
+        with open(BUDGETS_FILE, encoding='utf-8') as file:
+            cls.budgets = json.load(file)
+
+    def count_queries(self, client, path, params, limit=None):
+        path = path.format(**self.ids)
+        params = {
+            key: str(value).format(**self.ids)
+            for key, value in params.items()
+        }
+        if limit:
+            params['limit'] = limit
+        # Ответы и подсчёты из кэша скрыли бы запросы к базе.
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(path, params)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, path)
+        if limit:
+            self.assertEqual(len(response.data['results']), limit, path)
+        return len(context.captured_queries)
+
+    def measure(self, client, cases):
+        measured = {}
+        for name, path, params, paged in cases:
+            if not paged:
+                measured[name] = self.count_queries(client, path, params)
+                continue
+            counts = [
+                self.count_queries(client, path, params, limit)
+                for limit in PAGE_SIZES
+            ]
+            self.assertEqual(
+                counts[0], counts[1],
+                f'{name}: число запросов зависит от размера страницы '
+                f'(limit={PAGE_SIZES[0]}: {counts[0]}, '
+                f'limit={PAGE_SIZES[1]}: {counts[1]})'
+            )
+            measured[name] = counts[0]
+        return measured
+
+    def test_budgets(self):
+        client = APIClient()
+        measured = {'anonymous': self.measure(client, ANONYMOUS)}
+        client.force_authenticate(self.reader)
+        measured['authenticated'] = self.measure(client, AUTHENTICATED)
+        if os.getenv('UPDATE_QUERY_BUDGETS'):
+            self.budgets[connection.vendor] = measured
+            with open(BUDGETS_FILE, 'w', encoding='utf-8') as file:
+                json.dump(self.budgets, file, indent=2, sort_keys=True)
+                file.write('\n')
+            return
+        # В PostgreSQL пагинатор добавляет EXPLAIN для оценки count,
+        # поэтому бюджеты записаны отдельно для каждой СУБД.
+        budgets = self.budgets.get(connection.vendor)
+        if budgets is None:
+            self.skipTest(
+                f'В query_budgets.json нет бюджетов для {connection.vendor}.'
+            )
+        self.assertEqual(
+            {role: set(counts) for role, counts in budgets.items()},
+            {role: set(counts) for role, counts in measured.items()},
+            'Эндпоинты в query_budgets.json не совпадают с проверяемыми.'
+        )
+        for role, counts in measured.items():
+            for name, count in counts.items():
+                with self.subTest(role=role, endpoint=name):
+                    self.assertEqual(
+                        count, budgets[role][name],
+                        f'{role} {name}: {count} запросов, в бюджете '
+                        f'{budgets[role][name]}. Если так и должно '
+                        'быть, обновите query_budgets.json.'
+                    )
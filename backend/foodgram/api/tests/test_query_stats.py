@@ -0,0 +1,62 @@
+import json
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Recipe, Tag
+from rest_framework.test import APIClient
+from users.models import User
+
+RECIPES_URL = '/api/recipes/'
+
+
+@override_settings(QUERY_STATS_SAMPLE_RATE=1, QUERY_STATS_TOP=2)
+class QueryStatsTest(TestCase):
+    """ Учёт SQL-запросов в заголовках и логе. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass')
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#00FA9A', slug='breakfast')
+        for number in range(3):
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}',
+                text='Описание', cooking_time=10)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_headers_and_log(self):
+        with self.assertLogs('foodgram.queries') as logs:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(RECIPES_URL)
+        self.assertEqual(response.status_code, 200)
+        queries = len(context.captured_queries)
+        self.assertEqual(response['X-DB-Queries'], str(queries))
+        self.assertRegex(
+            response['Server-Timing'],
+            rf'^db;dur=[\d.]+;desc="{queries} queries", app;dur=[\d.]+$')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], RECIPES_URL)
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['queries'], queries)
+        self.assertEqual(len(record['slowest']), 2)
+        self.assertNotIn(self.author.email, logs.output[0])
+
+    def test_streaming_response_logged(self):
+        with self.assertLogs('foodgram.queries') as logs:
+            response = self.client.get(
+                f'{RECIPES_URL}download_shopping_cart/')
+            b''.join(response.streaming_content)
+        self.assertNotIn('X-DB-Queries', response)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertGreater(record['queries'], 0)
+
+    @override_settings(QUERY_STATS_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        response = self.client.get(RECIPES_URL)
+        self.assertNotIn('X-DB-Queries', response)
+        self.assertNotIn('Server-Timing', response)
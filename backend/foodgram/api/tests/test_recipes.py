@@ -0,0 +1,433 @@
+import os
+import shutil
+import tempfile
+from unittest import skipUnless
+
+from api.pagination import RecipePagination
+from api.serializers import RecipeCreateSerializer
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from users.models import Subscription, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+RECIPES_URL = '/api/recipes/'
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNo'
+    'AAAAggCByxOyYQAAAABJRU5ErkJggg=='
+)
+
+
+class RecipeFlagsTest(TestCase):
+    """ Флаги is_favorited/is_in_shopping_cart в ленте рецептов. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass')
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass')
+        cls.tag = Tag.objects.create(name='Завтрак', color='#00FA9A',
+                                     slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='абрикосы', measurement_unit='г')
+        for number in range(10):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}',
+                text='Описание', cooking_time=10)
+            recipe.tags.add(cls.tag)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=cls.ingredient, amount=5)
+        cls.favorite = Recipe.objects.first()
+        Favourite.objects.create(user=cls.user, recipe=cls.favorite)
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.favorite)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_flags_in_list(self):
+        response = self.client.get(RECIPES_URL, {'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        for recipe in response.data['results']:
+            expected = recipe['id'] == self.favorite.id
+            self.assertEqual(recipe['is_favorited'], expected)
+            self.assertEqual(recipe['is_in_shopping_cart'], expected)
+
+    def test_flags_in_detail(self):
+        response = self.client.get(f'{RECIPES_URL}{self.favorite.id}/')
+        self.assertTrue(response.data['is_favorited'])
+        self.assertTrue(response.data['is_in_shopping_cart'])
+
+    def test_flags_filters(self):
+        response = self.client.get(RECIPES_URL, {'is_favorited': 1})
+        self.assertEqual(response.data['count'], 1)
+        response = self.client.get(RECIPES_URL, {'is_in_shopping_cart': 1})
+        self.assertEqual(response.data['count'], 1)
+
+    def test_flags_do_not_add_queries_per_recipe(self):
+        def flag_queries(limit):
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(RECIPES_URL, {'limit': limit})
+            return [
+                query['sql'] for query in context.captured_queries
+                if 'recipes_favourite' in query['sql']
+                or 'recipes_shoppingcart' in query['sql']
+            ]
+
+        self.assertEqual(len(flag_queries(2)), len(flag_queries(10)))
+
+
+class RecipeListQueriesTest(TestCase):
+    """ Число запросов страницы рецептов не зависит от limit. """
+
+    @classmethod
+    def setUpTestData(cls):
+        tags = [
+            Tag.objects.create(name=f'Тег {number}', color='#00FA9A',
+                               slug=f'tag-{number}')
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(3)
+        ]
+        for number in range(20):
+            author = User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@foodgram.ru', password='pass')
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}',
+                text='Описание', cooking_time=10)
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in ingredients
+            ])
+
+    def count_queries(self, client, limit):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(RECIPES_URL, {'limit': limit})
+        self.assertEqual(len(response.data['results']), limit)
+        return len(context.captured_queries)
+
+    def test_anonymous_list_queries_fixed(self):
+        client = APIClient()
+        self.assertEqual(self.count_queries(client, 2),
+                         self.count_queries(client, 20))
+
+    def test_authenticated_list_queries_fixed(self):
+        client = APIClient()
+        reader = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass')
+        Subscription.objects.create(
+            user=reader, author=User.objects.get(username='author1'))
+        client.force_authenticate(reader)
+        self.assertEqual(self.count_queries(client, 2),
+                         self.count_queries(client, 20))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT,
+                   IMAGE_UPLOAD_ROOT=os.path.join(MEDIA_ROOT, 'uploads'))
+class RecipeSearchTest(TestCase):
+    """ Поиск рецептов по названию, описанию и ингредиентам. """
+
+    client_class = APIClient
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass')
+        cls.breakfast = Tag.objects.create(
+            name='Завтрак', color='#00FA9A', slug='breakfast')
+        cls.dinner = Tag.objects.create(
+            name='Ужин', color='#FF69B4', slug='dinner')
+        cls.apricot = Ingredient.objects.create(
+            name='абрикосы', measurement_unit='г')
+
+    def create_recipe(self, name, text, tag, ingredient):
+        response = self.client.post(RECIPES_URL, {
+            'name': name,
+            'text': text,
+            'cooking_time': 10,
+            'tags': [tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 5}],
+            'image': IMAGE,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def search(self, **params):
+        response = self.client.get(RECIPES_URL, params)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_search(self):
+        self.client.force_authenticate(self.user)
+        pie = self.create_recipe(
+            'пирог', 'сладкая выпечка', self.breakfast, self.apricot)
+        soup = self.create_recipe(
+            'суп', 'на ужин', self.dinner, Ingredient.objects.create(
+                name='морковь', measurement_unit='г'))
+        self.assertEqual(self.search(search='пирог'), [pie])
+        self.assertEqual(self.search(search='выпечка'), [pie])
+        self.assertEqual(self.search(search='абрикосы'), [pie])
+        self.assertEqual(self.search(search='морковь'), [soup])
+        self.assertEqual(
+            self.search(search='морковь', tags='breakfast'), [])
+        self.assertEqual(
+            self.search(search='морковь', tags='dinner'), [soup])
+
+    def test_search_after_update(self):
+        self.client.force_authenticate(self.user)
+        pie = self.create_recipe(
+            'пирог', 'сладкая выпечка', self.breakfast, self.apricot)
+        carrot = Ingredient.objects.create(
+            name='морковь', measurement_unit='г')
+        response = self.client.patch(f'{RECIPES_URL}{pie}/', {
+            'name': 'пирог',
+            'text': 'сладкая выпечка',
+            'cooking_time': 10,
+            'tags': [self.breakfast.id],
+            'ingredients': [{'id': carrot.id, 'amount': 5}],
+            'image': IMAGE,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.search(search='абрикосы'), [])
+        self.assertEqual(self.search(search='морковь'), [pie])
+
+
+class RecipeCursorPaginationTest(TestCase):
+    """ Лента рецептов по курсору (pub_date, id). """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass')
+        Recipe.objects.bulk_create([
+            Recipe(author=author, name=f'Рецепт {number}',
+                   text='Описание', cooking_time=10)
+            for number in range(15)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_pages_cover_feed_once(self):
+        expected = list(Recipe.objects.values_list('id', flat=True))
+        seen = []
+        response = self.client.get(RECIPES_URL, {'cursor': '', 'limit': 4})
+        while True:
+            self.assertNotIn('count', response.data)
+            seen.extend(recipe['id'] for recipe in response.data['results'])
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, expected)
+
+    def test_page_number_by_default(self):
+        response = self.client.get(RECIPES_URL, {'limit': 4})
+        self.assertEqual(response.data['count'], 15)
+        self.assertTrue(response.data['count_is_exact'])
+
+    def test_count_cached(self):
+        self.client.get(RECIPES_URL, {'limit': 4})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(RECIPES_URL, {'limit': 4, 'page': 2})
+        self.assertEqual(response.data['count'], 15)
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] for query in queries.captured_queries
+        ))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(RECIPES_URL, {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_keeps_other_ordering(self):
+        request = Request(APIRequestFactory().get(
+            RECIPES_URL, {'cursor': '', 'limit': 4}))
+        with self.assertRaises(ValidationError):
+            RecipePagination().paginate_queryset(
+                Recipe.objects.order_by('name'), request)
+        page = RecipePagination().paginate_queryset(
+            Recipe.objects.all(), request)
+        self.assertEqual(len(page), 4)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Нужен PostgreSQL.')
+    def test_cursor_with_search(self):
+        Recipe.objects.update_search_vector()
+        response = self.client.get(
+            RECIPES_URL, {'search': 'рецепт', 'cursor': ''})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.data)
+
+    def walk_pages(self, client):
+        ids = []
+        response = client.get(RECIPES_URL, {'limit': 4})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            if response.data['next'] is None:
+                return ids, response.data['count']
+            response = client.get(response.data['next'])
+
+    def test_stale_count_does_not_limit_pages(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get())
+        self.walk_pages(client)
+        # Число из кэша меньше настоящего: страницы не обрезаются.
+        author = User.objects.get()
+        Recipe.objects.bulk_create([
+            Recipe(author=author, name=f'Новый {number}',
+                   text='Описание', cooking_time=10)
+            for number in range(5)
+        ])
+        ids, count = self.walk_pages(client)
+        self.assertEqual(count, 15)
+        self.assertEqual(
+            ids, list(Recipe.objects.values_list('id', flat=True)))
+        # Число из кэша больше настоящего: пустых страниц со ссылкой
+        # на следующую нет.
+        Recipe.objects.filter(id__in=ids[:12]).delete()
+        ids, count = self.walk_pages(client)
+        self.assertEqual(count, 15)
+        self.assertEqual(len(ids), 8)
+        response = client.get(RECIPES_URL, {'limit': 4, 'page': 3})
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeUpdateTest(TestCase):
+    """ Изменение рецепта по разнице с текущими ингредиентами. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass')
+        cls.breakfast = Tag.objects.create(
+            name='Завтрак', color='#00FA9A', slug='breakfast')
+        cls.dinner = Tag.objects.create(
+            name='Ужин', color='#FF69B4', slug='dinner')
+        cls.ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(30)
+        ])
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Суп', text='Описание', cooking_time=10)
+        cls.recipe.tags.set([cls.breakfast])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=cls.recipe, ingredient=ingredient,
+                             amount=5)
+            for ingredient in cls.ingredients[:3]
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def patch(self, amounts, tags=(), name='Суп'):
+        response = self.client.patch(f'{RECIPES_URL}{self.recipe.id}/', {
+            'name': name,
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [tag.id for tag in tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in amounts
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def rows(self):
+        return {
+            ingredient: (pk, amount)
+            for pk, ingredient, amount
+            in RecipeIngredient.objects.filter(
+                recipe=self.recipe
+            ).values_list('pk', 'ingredient', 'amount')
+        }
+
+    def test_rows_kept(self):
+        first, second, third, fourth = self.ingredients[:4]
+        before = self.rows()
+        self.patch(
+            [(first, 5), (second, 7), (fourth, 3)],
+            tags=[self.dinner])
+        after = self.rows()
+        self.assertEqual(after[first.id], before[first.id])
+        self.assertEqual(after[second.id], (before[second.id][0], 7))
+        self.assertNotIn(third.id, after)
+        self.assertEqual(after[fourth.id][1], 3)
+        self.assertEqual(
+            list(self.recipe.tags.all()), [self.dinner])
+
+    def test_patch_name_only(self):
+        before = self.rows()
+        response = self.client.patch(
+            f'{RECIPES_URL}{self.recipe.id}/', {'name': 'Борщ'},
+            format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Борщ')
+        self.assertEqual(self.rows(), before)
+        self.assertEqual(
+            list(self.recipe.tags.all()), [self.breakfast])
+
+    def test_unchanged_ingredients(self):
+        before = self.rows()
+        with CaptureQueriesContext(connection) as queries:
+            self.patch(
+                [(ingredient, 5) for ingredient in self.ingredients[:3]],
+                tags=[self.breakfast], name='Борщ')
+        self.assertEqual(self.rows(), before)
+        # Поисковый вектор пересчитывается подзапросом к ингредиентам,
+        # поэтому проверяются только запросы, меняющие их таблицу.
+        writes = tuple(
+            f'{statement} "recipes_recipeingredient"'
+            for statement in ('INSERT INTO', 'UPDATE', 'DELETE FROM')
+        )
+        self.assertFalse(any(
+            query['sql'].startswith(writes)
+            for query in queries.captured_queries
+        ))
+
+    def test_queries_do_not_depend_on_ingredients(self):
+        def count_queries(ingredients, tag, amount):
+            recipe = Recipe.objects.get(pk=self.recipe.pk)
+            with CaptureQueriesContext(connection) as queries:
+                RecipeCreateSerializer().update(recipe, {
+                    'name': 'Суп',
+                    'text': 'Описание',
+                    'cooking_time': 10,
+                    'tags': [tag],
+                    'ingredients': [
+                        {'ingredient': ingredient, 'amount': amount}
+                        for ingredient in ingredients
+                    ],
+                })
+            return len(queries)
+
+        # Одно количество меняется, остальные ингредиенты заменяются.
+        first = self.ingredients[:1]
+        self.assertEqual(
+            count_queries(first + self.ingredients[3:6], self.dinner, 6),
+            count_queries(first + self.ingredients[6:], self.breakfast, 8))
@@ -0,0 +1,190 @@
+import io
+import threading
+
+from api.response_cache import ResponseCache
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from recipes.checks import check_shared_cache
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.test import APIClient
+from users.models import User
+
+TAGS_URL = '/api/tags/'
+INGREDIENTS_URL = '/api/ingredients/'
+RECIPES_URL = '/api/recipes/'
+STATS_URL = '/api/cache-stats/'
+
+
+class CatalogueCacheTest(TestCase):
+    """ Кэш ответов справочников тегов и ингредиентов. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(
+            name='Полдник', color='#00FA9A', slug='snack')
+        Ingredient.objects.create(name='абрикосы', measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_hit_without_queries(self):
+        first = self.get(TAGS_URL)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.get(TAGS_URL)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+
+    def test_keyed_by_query(self):
+        self.get(INGREDIENTS_URL, name='абр')
+        response = self.get(INGREDIENTS_URL, name='мор')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json(), [])
+
+    def test_invalidated_by_signals(self):
+        self.get(TAGS_URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'Перекус'
+            self.tag.save()
+        response = self.get(TAGS_URL)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()[0]['name'], 'Перекус')
+
+    def test_invalidated_by_load_ingredients(self):
+        self.get(INGREDIENTS_URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('load_ingredients', stdout=io.StringIO())
+        self.assertEqual(self.get(INGREDIENTS_URL)['X-Cache'], 'MISS')
+
+    def test_read_only(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@foodgram.ru', password='pass')
+        self.client.force_authenticate(admin)
+        response = self.client.post(
+            TAGS_URL, {'name': 'Ужин', 'color': '#000000', 'slug': 'dinner'})
+        self.assertEqual(response.status_code, 405)
+
+    def test_stats(self):
+        self.get(TAGS_URL)
+        self.get(TAGS_URL)
+        self.assertEqual(self.client.get(STATS_URL).status_code, 401)
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@foodgram.ru', password='pass')
+        self.client.force_authenticate(admin)
+        self.assertEqual(
+            self.get(STATS_URL).json()['catalogue'],
+            {'hits': 1, 'misses': 1}
+        )
+
+
+class RecipeCacheTest(TestCase):
+    """ Кэш ответов рецептов для анонимных запросов. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass',
+            first_name='Вася')
+        cls.recipes = Recipe.objects.bulk_create([
+            Recipe(author=cls.author, name=f'Рецепт {number}',
+                   text='Описание', cooking_time=10)
+            for number in range(8)
+        ])
+        cls.recipe = Recipe.objects.first()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_detail(self):
+        url = f'{RECIPES_URL}{self.recipe.id}/'
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    def test_first_pages_only(self):
+        self.client.get(RECIPES_URL, {'limit': 2, 'page': 3})
+        response = self.client.get(RECIPES_URL, {'limit': 2, 'page': 3})
+        self.assertEqual(response['X-Cache'], 'HIT')
+        response = self.client.get(RECIPES_URL, {'limit': 2, 'page': 4})
+        self.assertNotIn('X-Cache', response)
+
+    def test_authenticated_live(self):
+        self.client.force_authenticate(self.author)
+        self.client.get(RECIPES_URL)
+        self.assertNotIn('X-Cache', self.client.get(RECIPES_URL))
+
+    def test_invalidated_by_author(self):
+        url = f'{RECIPES_URL}{self.recipe.id}/'
+        self.client.get(url)
+        self.client.get(RECIPES_URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Петя'
+            self.author.save()
+        for response in (self.client.get(url), self.client.get(RECIPES_URL)):
+            self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['author']['first_name'],
+                         'Петя')
+
+    def test_invalidated_by_tags(self):
+        url = f'{RECIPES_URL}{self.recipe.id}/'
+        self.client.get(url)
+        tag = Tag.objects.create(
+            name='Полдник', color='#00FA9A', slug='snack')
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.recipe_set.add(self.recipe)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['tags'][0]['slug'], 'snack')
+
+
+class SingleFlightTest(SimpleTestCase):
+    """ Одновременные промахи по ключу рендерят ответ один раз. """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_waits_for_render(self):
+        response_cache = ResponseCache('test')
+        key = response_cache.make_key('key')
+        self.assertTrue(response_cache.acquire(key))
+        rendered = []
+
+        def render():
+            rendered.append(True)
+            return HttpResponse(b'{}', content_type='application/json')
+
+        def finish_render():
+            response_cache.store(key, render())
+            response_cache.release(key)
+
+        threading.Timer(0.1, finish_render).start()
+        response = response_cache.get_or_render(key, render)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(len(rendered), 1)
+
+
+class SharedCacheCheckTest(SimpleTestCase):
+    """ Предупреждение о кэше в памяти процесса при check --deploy. """
+
+    def test_local_memory(self):
+        self.assertEqual(
+            [warning.id for warning in check_shared_cache(None)],
+            ['recipes.W001']
+        )
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': 'memcached:11211',
+    }})
+    def test_shared(self):
+        self.assertEqual(check_shared_cache(None), [])
@@ -0,0 +1,84 @@
+import io
+
+from django.core.management import call_command
+from django.db.models import Count, F
+from django.test import TestCase
+from recipes.models import Favourite, Recipe, RecipeIngredient, ShoppingCart
+from recipes.seed import seed_database
+from users.models import Subscription, User
+
+
+def snapshot():
+    """ Данные без учёта id: номера пользователей и рецептов. """
+    users = {pk: number for number, pk in enumerate(
+        User.objects.order_by('id').values_list('id', flat=True))}
+    recipes = {pk: number for number, pk in enumerate(
+        Recipe.objects.order_by('id').values_list('id', flat=True))}
+    return (
+        sorted(
+            (recipes[recipe], ingredient, amount)
+            for recipe, ingredient, amount
+            in RecipeIngredient.objects.values_list(
+                'recipe', 'ingredient', 'amount')
+        ),
+        sorted(
+            (users[user], recipes[recipe])
+            for user, recipe in Favourite.objects.values_list(
+                'user', 'recipe')
+        ),
+        sorted(
+            (users[user], users[author])
+            for user, author in Subscription.objects.values_list(
+                'user', 'author')
+        ),
+    )
+
+
+class SeedFoodgramTest(TestCase):
+    """ Синтетические данные для бенчмарков. """
+
+    def seed(self, *args):
+        stdout = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                'seed_foodgram', '--users', '40', '--recipes', '200',
+                '--favourites', '800', '--carts', '80',
+                '--subscriptions', '200', *args, stdout=stdout)
+        # Последняя строка — время заполнения.
+        return stdout.getvalue().splitlines()[:-1]
+
+    def test_rows_created(self):
+        output = self.seed()
+        self.assertIn('recipes: 200', output)
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Recipe.objects.count(), 200)
+        self.assertEqual(ShoppingCart.objects.count(), 80)
+        self.assertGreater(Favourite.objects.count(), 700)
+        self.assertGreater(Subscription.objects.count(), 150)
+        self.assertFalse(Subscription.objects.filter(
+            user=F('author')).exists())
+        self.assertTrue(all(
+            2 <= count <= 10 for count in Recipe.objects.annotate(
+                count=Count('ingridients_recipe')
+            ).values_list('count', flat=True)
+        ))
+        stdout = io.StringIO()
+        call_command('rebuild_shopping_lists', '--check', stdout=stdout)
+
+    def test_power_law(self):
+        self.seed('--popularity-exponent', '1.5')
+        counts = sorted(Recipe.objects.annotate(
+            count=Count('in_favorite')
+        ).values_list('count', flat=True), reverse=True)
+        self.assertGreater(counts[0], 5 * counts[len(counts) // 2])
+
+    def test_reproducible(self):
+        first = self.seed()
+        data = snapshot()
+        User.objects.all().delete()
+        self.assertEqual(self.seed(), first)
+        self.assertEqual(snapshot(), data)
+        User.objects.all().delete()
+        seed_database(users=40, recipes=200, favourites=800,
+                      subscriptions=200, random_seed=2)
+        self.assertNotEqual(snapshot(), data)
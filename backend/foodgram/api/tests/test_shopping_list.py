@@ -0,0 +1,293 @@
+import csv
+import io
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from time import sleep
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+                            ShoppingListItem)
+from rest_framework.test import APIClient
+from users.models import User
+
+from .test_recipes import IMAGE
+
+MEDIA_ROOT = tempfile.mkdtemp()
+RECIPES_URL = '/api/recipes/'
+DOWNLOAD_URL = '/api/recipes/download_shopping_cart/'
+
+
+class DownloadShoppingCartTest(TestCase):
+    """ Скачивание списка покупок в разных форматах. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@foodgram.ru', password='pass',
+            first_name='Вася', last_name='Пупкин')
+        apricot = Ingredient.objects.create(
+            name='абрикосы', measurement_unit='г')
+        milk = Ingredient.objects.create(
+            name='молоко', measurement_unit='мл')
+        for amount in (100, 200):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {amount}',
+                text='Описание', cooking_time=10)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=apricot, amount=amount)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=milk, amount=amount // 10)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        ShoppingListItem.objects.refresh([cls.user.id], [apricot.id, milk.id])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, **params):
+        response = self.client.get(DOWNLOAD_URL, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_txt(self):
+        response, content = self.download()
+        today = datetime.today()
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(content.decode(), (
+            'Список покупок для: Вася Пупкин\n\n'
+            f'Дата: {today:%Y-%m-%d}\n\n'
+            '- абрикосы (г) - 300\n'
+            '- молоко (мл) - 30\n\n'
+            f'Foodgram ({today:%Y})'
+        ))
+
+    def test_csv(self):
+        response, content = self.download(format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('.csv', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(rows[1:], [
+            ['абрикосы', 'г', '300'],
+            ['молоко', 'мл', '30'],
+        ])
+
+    @skipUnless(os.path.exists(settings.SHOPPING_LIST_PDF_FONT),
+                'Нет шрифта для PDF')
+    def test_pdf(self):
+        response, content = self.download(format='pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF-'))
+        self.assertTrue(content.endswith(b'%%EOF\n'))
+        # Встроено подмножество шрифта, а не весь файл.
+        self.assertLess(
+            len(content), os.path.getsize(settings.SHOPPING_LIST_PDF_FONT) / 10
+        )
+
+    def test_unknown_format(self):
+        response = self.client.get(DOWNLOAD_URL, {'format': 'docx'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('errors', response.json())
+
+    def test_not_logged(self):
+        response = APIClient().get(DOWNLOAD_URL, {'format': 'pdf'})
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('detail', response.json())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT,
+                   IMAGE_UPLOAD_ROOT=os.path.join(MEDIA_ROOT, 'uploads'))
+class ShoppingListItemTest(TestCase):
+    """ Материализованный список покупок совпадает с корзинами. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass')
+        cls.buyers = [
+            User.objects.create_user(
+                username=f'buyer{number}',
+                email=f'buyer{number}@foodgram.ru', password='pass')
+            for number in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(3)
+        ]
+        cls.recipes = []
+        for number in range(2):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}',
+                text='Описание', cooking_time=10)
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in cls.ingredients[number:number + 2]
+            ])
+            cls.recipes.append(recipe)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def assert_consistent(self):
+        stored = set(ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'total_amount'))
+        live = {
+            (row['recipe__shoppingcart__user'], row['ingredient'],
+             row['total'])
+            for row in ShoppingListItem.objects.live_totals()
+        }
+        self.assertEqual(stored, live)
+
+    def add_all_to_carts(self):
+        for buyer in self.buyers:
+            client = self.client_for(buyer)
+            for recipe in self.recipes:
+                response = client.post(
+                    f'{RECIPES_URL}{recipe.id}/shopping_cart/')
+                self.assertEqual(response.status_code, 201)
+
+    def test_add_and_remove(self):
+        self.add_all_to_carts()
+        self.assert_consistent()
+        self.assertEqual(ShoppingListItem.objects.get(
+            user=self.buyers[0], ingredient=self.ingredients[1]
+        ).total_amount, 3)
+        response = self.client_for(self.buyers[0]).delete(
+            f'{RECIPES_URL}{self.recipes[0].id}/shopping_cart/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_consistent()
+        self.assertFalse(ShoppingListItem.objects.filter(
+            user=self.buyers[0], ingredient=self.ingredients[0]
+        ).exists())
+
+    def test_recipe_update(self):
+        self.add_all_to_carts()
+        recipe = self.recipes[0]
+        response = self.client_for(self.author).patch(
+            f'{RECIPES_URL}{recipe.id}/', {
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': 10,
+                'tags': [],
+                'ingredients': [
+                    {'id': self.ingredients[2].id, 'amount': 10},
+                ],
+                'image': IMAGE,
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assert_consistent()
+
+    def test_recipe_delete(self):
+        self.add_all_to_carts()
+        response = self.client_for(self.author).delete(
+            f'{RECIPES_URL}{self.recipes[1].id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_consistent()
+
+    def test_model_changes(self):
+        buyer = self.buyers[0]
+        recipe = self.recipes[0]
+        ShoppingCart.objects.create(user=buyer, recipe=recipe)
+        self.assert_consistent()
+        item = RecipeIngredient.objects.get(
+            recipe=recipe, ingredient=self.ingredients[0])
+        item.ingredient = self.ingredients[2]
+        item.amount = 7
+        item.save()
+        self.assert_consistent()
+        self.assertFalse(ShoppingListItem.objects.filter(
+            user=buyer, ingredient=self.ingredients[0]
+        ).exists())
+        item.delete()
+        self.assert_consistent()
+        ShoppingCart.objects.create(user=buyer, recipe=self.recipes[1])
+        recipe.delete()
+        self.assert_consistent()
+        self.assertTrue(ShoppingListItem.objects.filter(user=buyer).exists())
+
+    def test_rebuild_command(self):
+        self.add_all_to_carts()
+        ShoppingListItem.objects.filter(user=self.buyers[0]).delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_shopping_lists', '--check',
+                         stdout=io.StringIO(), stderr=io.StringIO())
+        call_command('rebuild_shopping_lists', stdout=io.StringIO())
+        self.assert_consistent()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Только для PostgreSQL')
+class ShoppingListConcurrencyTest(TransactionTestCase):
+    """ Одновременные изменения корзины одного пользователя. """
+
+    def setUp(self):
+        author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pass')
+        self.buyer = User.objects.create_user(
+            username='buyer', email='buyer@foodgram.ru', password='pass')
+        self.ingredient = Ingredient.objects.create(
+            name='ингредиент', measurement_unit='г')
+        self.recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {number}',
+                   text='Описание', cooking_time=10)
+            for number in range(2)
+        )
+        self.recipes = list(Recipe.objects.order_by('id'))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=self.ingredient,
+                             amount=number + 1)
+            for number, recipe in enumerate(self.recipes)
+        )
+
+    def test_first_item_created_once(self):
+        # Первая транзакция создаёт строку списка и держит её
+        # незакоммиченной, пока вторая добавляет в корзину свой рецепт.
+        refreshed = threading.Event()
+        errors = []
+
+        def add_to_cart(recipe, before_commit=None, wait=None):
+            try:
+                if wait is not None:
+                    wait.wait(5)
+                with transaction.atomic():
+                    ShoppingCart.objects.create(
+                        user=self.buyer, recipe=recipe)
+                    if before_commit is not None:
+                        before_commit.set()
+                        sleep(0.5)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=add_to_cart,
+                             args=(self.recipes[0], refreshed)),
+            threading.Thread(target=add_to_cart,
+                             args=(self.recipes[1], None, refreshed)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            list(ShoppingListItem.objects.filter(user=self.buyer).values_list(
+                'ingredient_id', 'total_amount')),
+            [(self.ingredient.id, 3)]
+        )
@@ -0,0 +1,116 @@
+from api.serializers import (get_subscribed_author_ids,
+                             reset_subscribed_author_ids)
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Recipe
+from rest_framework.test import APIClient, APIRequestFactory
+from users.models import Subscription, User
+
+USERS_URL = '/api/users/'
+SUBSCRIPTIONS_URL = '/api/users/subscriptions/'
+
+
+class SubscriptionsTest(TestCase):
+    """ Страница подписок с превью рецептов авторов. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass')
+        for number in range(10):
+            author = User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@foodgram.ru', password='pass')
+            Subscription.objects.create(user=cls.user, author=author)
+            Recipe.objects.bulk_create([
+                Recipe(author=author, name=f'Рецепт {index}',
+                       text='Описание', cooking_time=10)
+                for index in range(number + 1)
+            ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_recipes_limit_and_count(self):
+        response = self.client.get(
+            SUBSCRIPTIONS_URL, {'limit': 10, 'recipes_limit': 3})
+        self.assertEqual(response.status_code, 200)
+        for author in response.data['results']:
+            recipes_count = Recipe.objects.filter(
+                author_id=author['id']).count()
+            self.assertTrue(author['is_subscribed'])
+            self.assertEqual(author['recipes_count'], recipes_count)
+            self.assertEqual(len(author['recipes']), min(recipes_count, 3))
+            expected = list(Recipe.objects.filter(
+                author_id=author['id']
+            ).order_by('-pub_date', '-id').values_list('id', flat=True)[:3])
+            self.assertEqual(
+                [recipe['id'] for recipe in author['recipes']], expected)
+
+    def test_without_recipes_limit(self):
+        response = self.client.get(SUBSCRIPTIONS_URL, {'limit': 10})
+        for author in response.data['results']:
+            self.assertEqual(len(author['recipes']), author['recipes_count'])
+
+    def test_queries_fixed(self):
+        def count_queries(limit, recipes_limit):
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(SUBSCRIPTIONS_URL, {
+                    'limit': limit, 'recipes_limit': recipes_limit})
+            return len(context.captured_queries)
+
+        self.assertEqual(count_queries(2, 1), count_queries(10, 5))
+
+
+class IsSubscribedTest(TestCase):
+    """ Флаг is_subscribed в списке пользователей. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass')
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@foodgram.ru', password='pass')
+            for number in range(10)
+        ]
+        Subscription.objects.create(user=cls.user, author=cls.authors[0])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_users_list(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(USERS_URL, {'limit': 11})
+        subscribed = {
+            user['id'] for user in response.data['results']
+            if user['is_subscribed']
+        }
+        self.assertEqual(subscribed, {self.authors[0].id})
+        subscription_queries = [
+            query for query in context.captured_queries
+            if 'users_subscription' in query['sql']
+        ]
+        self.assertEqual(len(subscription_queries), 1)
+
+    def test_subscribed_ids_reset(self):
+        request = APIRequestFactory().get(USERS_URL)
+        request.user = self.user
+        self.assertEqual(get_subscribed_author_ids(request),
+                         {self.authors[0].id})
+        Subscription.objects.create(user=self.user, author=self.authors[2])
+        reset_subscribed_author_ids(request)
+        self.assertEqual(get_subscribed_author_ids(request),
+                         {self.authors[0].id, self.authors[2].id})
+
+    def test_subscribe_response(self):
+        author = self.authors[1]
+        response = self.client.post(f'{USERS_URL}{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['is_subscribed'])
@@ -0,0 +1,38 @@
+import io
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """ Пишет файл из multipart во временный файл кусками по chunk_size.
+
+    Файл не держится в памяти целиком. Если он больше
+    RECIPE_IMAGE_MAX_BYTES, временный файл удаляется, а остаток
+    потока только подсчитывается. Вместо файла тогда возвращается
+    пустая загрузка с настоящим size, и сериализатор отклоняет её
+    без декодирования.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.oversized = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.RECIPE_IMAGE_MAX_BYTES:
+            if not self.oversized:
+                self.oversized = True
+                self.file.close()
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.oversized:
+            return UploadedFile(
+                io.BytesIO(), name=self.file_name,
+                content_type=self.content_type, size=self.received,
+            )
+        return super().file_complete(file_size)
@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UsersViewSet
+from .views import (IngredientViewSet, RecipeViewSet, ResponseCacheStatsView,
+                    TagViewSet, UsersViewSet)
 
 router = routers.DefaultRouter()
 
@@ -13,4 +14,5 @@ router.register('tags', TagViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('cache-stats/', ResponseCacheStatsView.as_view()),
 ]
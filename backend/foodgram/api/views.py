@@ -1,51 +1,140 @@
 from datetime import datetime
 
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db.models import (BooleanField, Count, F, Prefetch, Value,
+                              prefetch_related_objects)
+from django.db.transaction import atomic
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import (Favourite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from recipes.models import (Favourite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from recipes.search import ingredient_index
+from recipes.stamps import (get_catalogue_stamp, get_recipes_stamp,
+                            get_user_stamp)
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.permissions import (SAFE_METHODS, IsAuthenticated,
+from rest_framework.parsers import FileUploadParser, MultiPartParser
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.views import APIView
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from users.models import Subscription, User
 
+from .conditional import ConditionalGetMixin
 from .filters import IngredientSearchFilter, RecipeFilterSet
-from .pagination import CustomPagination
+from .pagination import ApproximateCountPagination, RecipePagination
 from .permissions import IsAuthorOrAdminOrReadOnly
+from .response_cache import (RESPONSE_CACHES, CachedResponseMixin,
+                             catalogue_cache, recipes_cache)
 from .serializers import (FavoriteSerializer, IngredientSerializer,
-                          RecipeCreateSerializer, RecipeSerializer,
-                          ShoppingCartSerializer, SubscribeSerializer,
-                          SubscriptionsSerializer, TagSerializer)
+                          RecipeCreateSerializer, RecipeImageUploadSerializer,
+                          RecipeSerializer, ShoppingCartSerializer,
+                          SubscribeSerializer, SubscriptionsSerializer,
+                          TagSerializer, reset_subscribed_author_ids)
+from .shopping_list import SHOPPING_LIST_FORMATS
+from .uploads import ImageUploadHandler
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, CachedResponseMixin, ModelViewSet):
     """ Методы работы с рецептом. Добавление, удаление,
         а так же методы работы с корзиной покупок.  """
 
     permission_classes = (IsAuthorOrAdminOrReadOnly, IsAuthenticatedOrReadOnly)
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
     queryset = Recipe.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilterSet
     serializer_class = RecipeSerializer
+    response_cache = recipes_cache
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Файлы из multipart пишутся на диск кусками и не дальше лимита.
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = Recipe.objects.with_user_flags(self.request.user)
+        if self.request.method in SAFE_METHODS:
+            return queryset.with_related()
+        return queryset
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeSerializer
         return RecipeCreateSerializer
 
+    def get_list_stamps(self):
+        return (
+            get_recipes_stamp(),
+            get_catalogue_stamp(),
+            get_user_stamp(self.request.user),
+        )
+
+    def get_updated_at(self):
+        if not hasattr(self, '_updated_at'):
+            self._updated_at = Recipe.objects.filter(
+                pk=self.kwargs['pk']
+            ).values_list('updated_at', flat=True).first()
+        return self._updated_at
+
+    def get_object_stamps(self):
+        updated_at = self.get_updated_at()
+        if updated_at is None:
+            return None
+        return (
+            updated_at.timestamp(),
+            get_catalogue_stamp(),
+            get_user_stamp(self.request.user),
+        )
+
+    def get_response_cache_stamp(self):
+        # Для анонимов флаги всегда False и ответ одинаков для всех.
+        if self.request.user.is_authenticated:
+            return None
+        if self.action == 'retrieve':
+            updated_at = self.get_updated_at()
+            if updated_at is None:
+                return None
+            return (updated_at.timestamp(), get_catalogue_stamp())
+        if not self.is_first_pages():
+            return None
+        return (get_recipes_stamp(), get_catalogue_stamp())
+
+    def is_first_pages(self):
+        params = self.request.query_params
+        if params.get(self.paginator.cursor_query_param):
+            return False
+        page = params.get(self.paginator.page_query_param, '1')
+        return page.isdigit() and int(page) <= settings.RECIPE_CACHE_PAGES
+
+    @atomic
+    def perform_destroy(self, instance):
+        # Список покупок пересчитывается сигналами один раз на рецепт,
+        # а не на каждую корзину и строку ингредиентов.
+        with ShoppingListItem.objects.deferred_refresh():
+            instance.delete()
+
+    def perform_content_negotiation(self, request, force=False):
+        if self.action == 'download_shopping_cart':
+            # ?format= выбирает формат файла, а не рендерер DRF,
+            # ошибки этого метода отдаются в JSON.
+            renderer = JSONRenderer()
+            return renderer, renderer.media_type
+        return super().perform_content_negotiation(request, force)
+
     @staticmethod
     def post_method_for_actions(request, pk, serializers):
         data = {'user': request.user.id, 'recipe': pk}
         serializer = serializers(data=data, context={'request': request})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        # Сигналы пересчитывают список покупок в той же транзакции.
+        with atomic():
+            serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
@@ -72,32 +161,51 @@ class RecipeViewSet(ModelViewSet):
     )
     def download_shopping_cart(self, request):
         user = request.user
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': (
+                    'Неизвестный формат. Доступны: '
+                    f'{", ".join(SHOPPING_LIST_FORMATS)}.'
+                )},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        content_type, render = SHOPPING_LIST_FORMATS[file_format]
 
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shoppingcart__user=request.user
+        ingredients = ShoppingListItem.objects.filter(
+            user=user
         ).values(
             'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        today = datetime.today()
-        shopping_list = (
-            f'Список покупок для: {user.get_full_name()}\n\n'
-            f'Дата: {today:%Y-%m-%d}\n\n'
+            'ingredient__measurement_unit',
+            amount=F('total_amount')
+        ).order_by('ingredient__name')
+
+        filename = f'{user.username}_shopping_list.{file_format}'
+        response = StreamingHttpResponse(
+            render(user, ingredients.iterator(), datetime.today()),
+            content_type=content_type
         )
-        shopping_list += '\n'.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
-        shopping_list += f'\n\nFoodgram ({today:%Y})'
-
-        filename = f'{user.username}_shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
         response['Content-Disposition'] = f'attachment; filename={filename}'
 
         return response
 
+    @action(
+        detail=True, methods=['put'],
+        parser_classes=(MultiPartParser, FileUploadParser),
+    )
+    def image(self, request, pk):
+        """ Новая картинка рецепта: поле image в multipart/form-data
+            или тело запроса целиком (Content-Disposition с filename). """
+        recipe = self.get_object()
+        data = {'image': request.data.get('image', request.data.get('file'))}
+        serializer = RecipeImageUploadSerializer(
+            recipe, data=data, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        with atomic():
+            serializer.save()
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
     @action(detail=True, methods=['post'])
     def favorite(self, request, pk):
         return self.post_method_for_actions(
@@ -112,7 +220,7 @@ class RecipeViewSet(ModelViewSet):
 class UsersViewSet(UserViewSet):
     """ Отображение страницы юзера. Операция подписки/отписки. """
 
-    pagination_class = CustomPagination
+    pagination_class = ApproximateCountPagination
 
     @action(['get'], detail=False, permission_classes=[IsAuthenticated])
     def me(self, request, *args, **kwargs):
@@ -122,8 +230,20 @@ class UsersViewSet(UserViewSet):
     @action(methods=['get'], detail=False)
     def subscriptions(self, request):
         subscriptions_list = self.paginate_queryset(
-            User.objects.filter(author__user=request.user)
+            User.objects.filter(author__user=request.user).annotate(
+                recipes_count=Count('recipe'),
+                is_subscribed=Value(True, output_field=BooleanField()),
+            ).order_by('id')
         )
+        recipes_limit = request.query_params.get('recipes_limit')
+        prefetch_related_objects(subscriptions_list, Prefetch(
+            'recipe_set',
+            queryset=Recipe.objects.latest_by_author(
+                subscriptions_list,
+                int(recipes_limit) if recipes_limit else None
+            ).order_by('-pub_date', '-id'),
+            to_attr='preview_recipes',
+        ))
         serializer = SubscriptionsSerializer(
             subscriptions_list, many=True, context={
                 'request': request
@@ -140,6 +260,7 @@ class UsersViewSet(UserViewSet):
                 user=request.user
             )
             self.perform_destroy(subscription)
+            reset_subscribed_author_ids(request)
             return Response(status=status.HTTP_204_NO_CONTENT)
         serializer = SubscribeSerializer(
             data={
@@ -150,20 +271,61 @@ class UsersViewSet(UserViewSet):
         )
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        reset_subscribed_author_ids(request)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class IngredientViewSet(ModelViewSet):
+class CatalogueViewSet(ConditionalGetMixin, CachedResponseMixin,
+                       ReadOnlyModelViewSet):
+    """ Справочник: версия общая для тегов и ингредиентов.
+
+    Только чтение, чтобы изменения шли через модели и сигналы,
+    которые сбрасывают кэш ответов.
+    """
+
+    response_cache = catalogue_cache
+
+    def get_list_stamps(self):
+        return (get_catalogue_stamp(),)
+
+    def get_object_stamps(self):
+        return (get_catalogue_stamp(),)
+
+    def get_response_cache_stamp(self):
+        return get_catalogue_stamp()
+
+
+class IngredientViewSet(CatalogueViewSet):
     """ Отображение ингредиентов. """
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
+
+    def filter_queryset(self, queryset):
+        name = IngredientSearchFilter().get_search_name(self.request)
+        if (self.action == 'list' and name
+                and settings.INGREDIENT_SEARCH_INDEX):
+            return ingredient_index.search(
+                name, settings.INGREDIENT_SEARCH_LIMIT
+            )
+        return super().filter_queryset(queryset)
 
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(CatalogueViewSet):
     """ Отображение тегов. """
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+
+
+class ResponseCacheStatsView(APIView):
+    """ Счётчики попаданий и промахов кэша ответов. """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response({
+            name: response_cache.stats()
+            for name, response_cache in RESPONSE_CACHES.items()
+        })
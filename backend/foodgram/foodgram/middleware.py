@@ -0,0 +1,101 @@
+import heapq
+import json
+import logging
+import random
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('foodgram.queries')
+
+
+class QueryStats:
+    """ execute_wrapper, который считает SQL-запросы запроса.
+
+    Запоминает число запросов, их общее время и QUERY_STATS_TOP самых
+    медленных. Текст запроса хранится без параметров, поэтому в лог не
+    попадают данные пользователей.
+    """
+
+    def __init__(self, top):
+        self.top = top
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            if len(self.slowest) < self.top:
+                heapq.heappush(self.slowest, (duration, sql))
+            elif self.slowest and duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (duration, sql))
+
+    def wrap(self, stack):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+
+
+class QueryStatsMiddleware:
+    """ Считает SQL-запросы для доли QUERY_STATS_SAMPLE_RATE запросов.
+
+    Работает без DEBUG. В ответ добавляются заголовки Server-Timing
+    (db — время в базе, app — всё время обработки) и X-DB-Queries,
+    в логгер foodgram.queries пишется строка JSON. У потоковых ответов
+    запросы идут при отдаче тела, уже после заголовков, поэтому
+    они только пишутся в лог по окончании ответа.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.QUERY_STATS_SAMPLE_RATE
+        if rate <= 0 or random.random() >= rate:
+            return self.get_response(request)
+        stats = QueryStats(settings.QUERY_STATS_TOP)
+        start = perf_counter()
+        with ExitStack() as stack:
+            stats.wrap(stack)
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, stats, request, response, start
+            )
+            return response
+        elapsed = perf_counter() - start
+        response['Server-Timing'] = (
+            f'db;dur={stats.duration * 1000:.1f};'
+            f'desc="{stats.count} queries", '
+            f'app;dur={elapsed * 1000:.1f}'
+        )
+        response['X-DB-Queries'] = str(stats.count)
+        self.log(stats, request, response, elapsed)
+        return response
+
+    def stream(self, content, stats, request, response, start):
+        with ExitStack() as stack:
+            stats.wrap(stack)
+            yield from content
+        self.log(stats, request, response, perf_counter() - start)
+
+    def log(self, stats, request, response, elapsed):
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': stats.count,
+            'db_ms': round(stats.duration * 1000, 1),
+            'total_ms': round(elapsed * 1000, 1),
+            'slowest': [
+                {'ms': round(duration * 1000, 1), 'sql': sql}
+                for duration, sql in sorted(stats.slowest, reverse=True)
+            ],
+        }, ensure_ascii=False))
@@ -0,0 +1,100 @@
+"""
+Операции миграций, которые в PostgreSQL создают и удаляют индексы
+через CREATE/DROP INDEX CONCURRENTLY, не блокируя запись в таблицу.
+В остальных СУБД (SQLite в тестах) выполняются как обычные операции
+Django. Миграция с такими операциями должна быть atomic = False.
+"""
+from django.contrib.postgres import operations as postgres
+from django.db.migrations import AddIndex, AlterField, RemoveIndex
+
+
+def is_postgresql(schema_editor):
+    return schema_editor.connection.vendor == 'postgresql'
+
+
+class AddIndexConcurrently(postgres.AddIndexConcurrently):
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if is_postgresql(schema_editor):
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        return AddIndex.database_forwards(
+            self, app_label, schema_editor, from_state, to_state
+        )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if is_postgresql(schema_editor):
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        return AddIndex.database_backwards(
+            self, app_label, schema_editor, from_state, to_state
+        )
+
+
+class RemoveIndexConcurrently(postgres.RemoveIndexConcurrently):
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if is_postgresql(schema_editor):
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        return RemoveIndex.database_forwards(
+            self, app_label, schema_editor, from_state, to_state
+        )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if is_postgresql(schema_editor):
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        return RemoveIndex.database_backwards(
+            self, app_label, schema_editor, from_state, to_state
+        )
+
+
+class AlterIndexConcurrently(postgres.NotInTransactionMixin, AlterField):
+    """ Меняет только db_index у поля.
+
+    Индекс поля, например неявный индекс внешнего ключа, создаётся
+    или удаляется CONCURRENTLY; остальные свойства поля не трогаются.
+    """
+
+    atomic = False
+
+    def describe(self):
+        return 'Concurrently alter index of %s on %s' % (
+            self.name, self.model_name
+        )
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if not is_postgresql(schema_editor):
+            super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+            return
+        self._ensure_not_in_transaction(schema_editor)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        old_field = from_state.apps.get_model(
+            app_label, self.model_name
+        )._meta.get_field(self.name)
+        new_field = model._meta.get_field(self.name)
+        if old_field.db_index and not new_field.db_index:
+            for name in schema_editor._constraint_names(
+                model, [new_field.column], index=True, unique=False
+            ):
+                schema_editor.execute(schema_editor._delete_index_sql(
+                    model, name, concurrently=True
+                ))
+        elif new_field.db_index and not old_field.db_index:
+            schema_editor.execute(schema_editor._create_index_sql(
+                model, fields=[new_field], concurrently=True
+            ))
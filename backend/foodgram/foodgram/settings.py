@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -108,6 +109,20 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Кэш Django. В нём лежат метки и версии (recipes.stamps,
+# recipes.search), которые меняют и gunicorn, и image_worker, и команды
+# manage.py, поэтому в docker-compose это общий memcached. LocMemCache
+# по умолчанию годится только для разработки и тестов в одном процессе.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -152,3 +167,100 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Поиск ингредиентов через индекс в памяти процесса (recipes.search).
+# При False поиск идёт в БД через IngredientSearchFilter.
+INGREDIENT_SEARCH_INDEX = (
+    os.getenv('INGREDIENT_SEARCH_INDEX', default='True') == 'True'
+)
+# Сколько ингредиентов отдаёт поиск по имени (подсказки в форме
+# рецепта). По умолчанию ограничения нет: ответ не постраничный, и
+# фронтенд получает все совпадения.
+INGREDIENT_SEARCH_LIMIT = (
+    int(os.getenv('INGREDIENT_SEARCH_LIMIT'))
+    if os.getenv('INGREDIENT_SEARCH_LIMIT') else None
+)
+
+# TrueType шрифт с кириллицей для списка покупок в PDF.
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Приблизительный count в пагинации (api.pagination).
+# Точный count кэшируется на PAGINATION_COUNT_CACHE_TIMEOUT секунд,
+# выше порога вместо COUNT(*) отдаётся оценка планировщика PostgreSQL.
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', default=30)
+)
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = int(
+    os.getenv('PAGINATION_COUNT_ESTIMATE_THRESHOLD', default=10000)
+)
+
+# Время жизни отрендеренных ответов в кэше (api.response_cache), секунды.
+RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_TIMEOUT', default=24 * 60 * 60)
+)
+
+# Сколько секунд одновременные промахи по одному ключу ждут, пока
+# первый запрос отрендерит ответ.
+RESPONSE_CACHE_LOCK_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_LOCK_TIMEOUT', default=5)
+)
+
+# Сколько первых страниц ленты кэшируется для анонимных запросов.
+RECIPE_CACHE_PAGES = int(os.getenv('RECIPE_CACHE_PAGES', default=3))
+
+# Варианты картинки рецепта (recipes.images): рамка (ширина, высота),
+# в которую вписывается изображение. Каждый вариант — WebP и JPEG.
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+
+# Сколько секунд файл картинки без ссылок из рецептов хранится до
+# удаления (recipes.images.delete_orphan_images).
+RECIPE_IMAGE_ORPHAN_TTL = int(
+    os.getenv('RECIPE_IMAGE_ORPHAN_TTL', default=24 * 60 * 60)
+)
+
+# Необработанные загрузки картинок (recipes.storage.UploadStorage) до
+# проверки воркером process_image_jobs. Не должны раздаваться nginx.
+IMAGE_UPLOAD_ROOT = os.getenv(
+    'IMAGE_UPLOAD_ROOT', default=os.path.join(BASE_DIR, 'uploads')
+)
+
+# Ограничения загружаемой картинки рецепта: размер файла в байтах и
+# сторона в пикселях. Проверяются до декодирования изображения.
+RECIPE_IMAGE_MAX_BYTES = int(
+    os.getenv('RECIPE_IMAGE_MAX_BYTES', default=10 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_DIMENSION = int(
+    os.getenv('RECIPE_IMAGE_MAX_DIMENSION', default=6000)
+)
+
+# Учёт SQL-запросов (foodgram.middleware.QueryStatsMiddleware): доля
+# запросов, для которых считаются запросы к базе (0 — выключено, 1 —
+# все), и сколько самых медленных запросов пишется в лог.
+QUERY_STATS_SAMPLE_RATE = float(
+    os.getenv('QUERY_STATS_SAMPLE_RATE', default=0)
+)
+QUERY_STATS_TOP = int(os.getenv('QUERY_STATS_TOP', default=3))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram.queries': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
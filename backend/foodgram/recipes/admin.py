@@ -1,7 +1,7 @@
 from django.contrib import admin
 
-from .models import (Favourite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+from .models import (Favourite, ImageJob, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, ShoppingListItem, StoredImage, Tag)
 
 
 @admin.register(Recipe)
@@ -41,3 +41,22 @@ class FavoriteAdmin(admin.ModelAdmin):
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe',)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'total_amount',)
+
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'status', 'attempts', 'created_at',)
+    list_filter = ('status',)
+    readonly_fields = ('recipe', 'upload', 'attempts', 'error',)
+
+
+@admin.register(StoredImage)
+class StoredImageAdmin(admin.ModelAdmin):
+    list_display = ('name', 'references', 'updated_at',)
+    search_fields = ('name',)
+    readonly_fields = ('name', 'variants', 'references', 'updated_at',)
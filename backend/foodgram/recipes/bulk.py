@@ -0,0 +1,74 @@
+import csv
+import io
+from itertools import islice
+
+from django.db import connection
+
+# Параметры COPY для RowStream. В CSV без кавычек пустое поле по
+# умолчанию читается как NULL, поэтому NULL обозначается \N, а пустая
+# строка остаётся пустой строкой.
+COPY_OPTIONS = "FORMAT csv, NULL '\\N'"
+COPY_NULL = '\\N'
+
+
+class RowStream(io.RawIOBase):
+    """ Файловый объект для COPY, который по запросу превращает
+        строки в CSV и не держит весь файл в памяти. None пишется
+        как COPY_NULL. """
+
+    def __init__(self, rows, batch_size):
+        self.rows = iter(rows)
+        self.batch_size = batch_size
+        self.buffer = b''
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            batch = list(islice(self.rows, self.batch_size))
+            if not batch:
+                break
+            self.count += len(batch)
+            chunk = io.StringIO()
+            csv.writer(chunk).writerows(
+                [COPY_NULL if value is None else value for value in row]
+                for row in batch
+            )
+            self.buffer += chunk.getvalue().encode()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def insert_rows(model, columns, rows, batch_size):
+    """ Вставляет кортежи rows в таблицу model, минуя модели Django.
+
+    Значения должны быть уже в виде для базы (connection.ops.adapt_*).
+    В PostgreSQL строки идут одним COPY, в остальных базах —
+    executemany пачками по batch_size. Возвращает число строк.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    names = ', '.join(connection.ops.quote_name(column) for column in columns)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            stream = RowStream(rows, batch_size)
+            cursor.copy_expert(
+                f'COPY {table} ({names}) FROM STDIN WITH ({COPY_OPTIONS})',
+                stream
+            )
+            return stream.count
+        sql = (
+            f'INSERT INTO {table} ({names}) '
+            f'VALUES ({", ".join(["%s"] * len(columns))})'
+        )
+        rows = iter(rows)
+        count = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return count
+            cursor.executemany(sql, batch)
+            count += len(batch)
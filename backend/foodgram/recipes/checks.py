@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """ Метки и версии из recipes.stamps и recipes.search должны быть
+        видны всем процессам: gunicorn, image_worker и manage.py. """
+    if settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        'Кэш по умолчанию хранится в памяти процесса: изменения из '
+        'image_worker и команд manage.py не сбросят кэш ответов gunicorn.',
+        hint='Задайте CACHE_BACKEND и CACHE_LOCATION общего кэша, '
+             'например memcached из infra/docker-compose.yml.',
+        id='recipes.W001',
+    )]
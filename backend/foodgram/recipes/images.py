@@ -0,0 +1,232 @@
+import io
+import posixpath
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import ImageJob, ImageStatus, Recipe, StoredImage
+from .stamps import bump_recipes_stamp
+from .storage import image_storage
+
+# Форматы, которые принимаются от клиента, и формат, в который
+# картинка перекодируется: (формат Pillow, расширение, параметры).
+UPLOAD_FORMATS = {
+    'JPEG': ('JPEG', 'jpg', {'quality': 90}),
+    'PNG': ('PNG', 'png', {'optimize': True}),
+    'GIF': ('PNG', 'png', {'optimize': True}),
+    'WEBP': ('WEBP', 'webp', {'quality': 90}),
+}
+IMAGE_DECODE_ERRORS = (
+    OSError, SyntaxError, ValueError, Image.DecompressionBombError
+)
+
+IMAGE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def variant_name(image_name, size, extension):
+    """ Имя файла варианта рядом с оригиналом, в подкаталоге variants. """
+    directory, filename = posixpath.split(image_name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(
+        directory, 'variants', f'{stem}_{size}.{extension}'
+    )
+
+
+def open_image(image_file):
+    image = ImageOps.exif_transpose(Image.open(image_file))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def encode_image(image, extension):
+    image_format, options = IMAGE_FORMATS[extension]
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def render_variants(image_name, storage=image_storage, replace=False):
+    """ Создаёт варианты картинки и возвращает их имена.
+
+    Размеры берутся из RECIPE_IMAGE_VARIANTS: картинка вписывается
+    в рамку с сохранением пропорций и не увеличивается. Каждый
+    размер сохраняется в WebP и JPEG. Уже созданные файлы вариантов
+    остаются как есть, если не передан replace. Функция не обращается
+    к БД, поэтому её можно вызывать из пула процессов.
+    """
+    with storage.open(image_name, 'rb') as image_file:
+        original = open_image(image_file)
+    variants = {}
+    for size, box in settings.RECIPE_IMAGE_VARIANTS.items():
+        image = original.copy()
+        image.thumbnail(box, Image.LANCZOS)
+        variants[size] = {}
+        for extension in IMAGE_FORMATS:
+            name = variant_name(image_name, size, extension)
+            if replace:
+                storage.delete(name)
+            variants[size][extension] = storage.store(
+                name, ContentFile(encode_image(image, extension))
+            )
+    return variants
+
+
+def enqueue_image(recipe, content):
+    """ Сохраняет загрузку как есть и ставит её в очередь воркеру.
+
+    Pillow здесь не вызывается: проверка, перекодирование и варианты
+    делаются в process_image_job. Необработанные задачи этого рецепта
+    больше не нужны и удаляются.
+    """
+    superseded = list(ImageJob.objects.filter(
+        recipe=recipe, status=ImageJob.PENDING
+    ))
+    ImageJob.objects.filter(pk__in=[job.pk for job in superseded]).delete()
+    transaction.on_commit(lambda: [
+        job.upload.delete(save=False) for job in superseded
+    ])
+    job = ImageJob(recipe=recipe)
+    job.upload.save(uuid4().hex, content, save=False)
+    # Временный файл загрузки уже перемещён в хранилище.
+    content.close()
+    job.save()
+    Recipe.objects.filter(pk=recipe.pk).update(
+        image_status=ImageStatus.PENDING, updated_at=timezone.now()
+    )
+    recipe.image_status = ImageStatus.PENDING
+    return job
+
+
+def read_image_header(image_file):
+    """ Формат и размер картинки по заголовку, без декодирования.
+
+    Image.open читает только заголовок файла, пиксели не загружаются.
+    Бросает одну из IMAGE_DECODE_ERRORS, если это не картинка.
+    """
+    with Image.open(image_file) as image:
+        image_format, size = image.format, image.size
+    image_file.seek(0)
+    return image_format, size
+
+
+def reencode_upload(upload):
+    """ Проверяет загрузку и перекодирует её без метаданных.
+
+    Возвращает (байты, расширение) или бросает одну из
+    IMAGE_DECODE_ERRORS.
+    """
+    with Image.open(upload) as image:
+        if image.format not in UPLOAD_FORMATS:
+            raise ValueError(f'Неподдерживаемый формат: {image.format}.')
+        image_format, extension, options = UPLOAD_FORMATS[image.format]
+        image.verify()
+    upload.seek(0)
+    with Image.open(upload) as image:
+        image = ImageOps.exif_transpose(image)
+        if image_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, image_format, **options)
+    return buffer.getvalue(), extension
+
+
+def process_image_job(job):
+    """ Обрабатывает задачу: картинка рецепта и её варианты.
+
+    Файл называется по хешу перекодированной картинки. Если такая
+    картинка уже есть в хранилище, она и её варианты используются
+    повторно. Если для рецепта уже поставлена более новая загрузка,
+    результат этой задачи не ставится в рецепт. Возвращает итоговый
+    статус задачи.
+    """
+    try:
+        with job.upload.open('rb') as upload:
+            content, extension = reencode_upload(upload)
+        content = ContentFile(content)
+        name = image_storage.hashed_name(
+            Recipe._meta.get_field('image').generate_filename(
+                None, f'image.{extension}'
+            ),
+            content
+        )
+        variants = StoredImage.objects.touch(name)
+        image_storage.store(name, content)
+        if not variants:
+            variants = render_variants(name)
+            StoredImage.objects.filter(name=name).update(variants=variants)
+    except IMAGE_DECODE_ERRORS as error:
+        # Сохранённые файлы без ссылок удалит delete_orphan_images.
+        return finish_image_job(job, ImageJob.FAILED, error=str(error))
+    return finish_image_job(job, ImageJob.DONE, name, variants)
+
+
+def variant_names(variants):
+    return {name for names in variants.values() for name in names.values()}
+
+
+def delete_files(names):
+    for name in names:
+        image_storage.delete(name)
+
+
+def finish_image_job(job, status, image_name=None, variants=None, error=''):
+    with transaction.atomic():
+        recipe = Recipe.objects.select_for_update().filter(
+            pk=job.recipe_id
+        ).first()
+        current = recipe is not None and not ImageJob.objects.filter(
+            recipe_id=job.recipe_id, pk__gt=job.pk,
+            status__in=(ImageJob.PENDING, ImageJob.PROCESSING),
+        ).exists()
+        if current:
+            changes = {'image_status': ImageStatus.FAILED}
+            if image_name:
+                changes = {
+                    'image': image_name,
+                    'image_variants': variants,
+                    'image_status': ImageStatus.READY,
+                }
+                if recipe.image.name != image_name:
+                    StoredImage.objects.retain(image_name)
+                    if recipe.image:
+                        StoredImage.objects.release(recipe.image.name)
+            Recipe.objects.filter(pk=recipe.pk).update(
+                updated_at=timezone.now(), **changes
+            )
+            transaction.on_commit(bump_recipes_stamp)
+        ImageJob.objects.filter(pk=job.pk).update(
+            status=status, error=error, updated_at=timezone.now()
+        )
+    job.upload.delete(save=False)
+    return status
+
+
+def delete_orphan_images(older_than):
+    """ Удаляет файлы картинок, на которые не ссылается ни один рецепт.
+
+    Файл без ссылок живёт ещё older_than: за это время его может
+    снова взять process_image_job. Строки блокируются до удаления
+    файлов, так что touch() ждёт окончания чистки и сохраняет файл
+    заново. Возвращает число удалённых картинок.
+    """
+    with transaction.atomic():
+        orphans = list(StoredImage.objects.orphans(
+            older_than
+        ).select_for_update(skip_locked=True))
+        for stored in orphans:
+            delete_files({stored.name} | variant_names(stored.variants))
+        StoredImage.objects.filter(
+            pk__in=[stored.pk for stored in orphans]
+        ).delete()
+    return len(orphans)
@@ -0,0 +1,67 @@
+from timeit import repeat
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.models import Ingredient
+from recipes.search import ingredient_index, search_ingredients
+
+
+class Command(BaseCommand):
+    """
+    Команда 'benchmark_ingredient_search' сравнивает поиск
+    ингредиентов по имени через индекс в памяти и через ORM.
+    """
+
+    help = 'Сравнивает поиск ингредиентов через индекс и через ORM.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'prefixes', nargs='*', default=['а', 'мо', 'сол', 'кар'],
+            help='Префиксы для поиска.'
+        )
+        parser.add_argument(
+            '--number', type=int, default=200,
+            help='Количество запросов на префикс в одном замере.'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=settings.INGREDIENT_SEARCH_LIMIT,
+            help='Сколько ингредиентов отдаёт один поиск (по умолчанию все).'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Количество замеров, берётся лучший.'
+        )
+
+    def handle(self, *args, **options):
+        number = options['number']
+        limit = options['limit']
+        ingredient_index.search('')
+        self.stdout.write(
+            f'Ингредиентов в каталоге: {Ingredient.objects.count()}'
+        )
+        for prefix in options['prefixes']:
+            index_results = ingredient_index.search(prefix, limit)
+            orm_results = list(search_ingredients(
+                Ingredient.objects.all(), prefix, limit
+            ).values('id', 'name', 'measurement_unit'))
+            index_time = min(repeat(
+                lambda: ingredient_index.search(prefix, limit),
+                number=number, repeat=options['repeat']
+            )) / number
+            orm_time = min(repeat(
+                lambda: list(search_ingredients(
+                    Ingredient.objects.all(), prefix, limit
+                ).values('id', 'name', 'measurement_unit')),
+                number=number, repeat=options['repeat']
+            )) / number
+            matches = (
+                {row['id'] for row in index_results}
+                == {row['id'] for row in orm_results}
+            )
+            self.stdout.write(
+                f'{prefix!r}: найдено {len(index_results)}, '
+                f'индекс {index_time * 1e6:.1f} мкс, '
+                f'ORM {orm_time * 1e6:.1f} мкс, '
+                f'ускорение x{orm_time / index_time:.1f}, '
+                f'результаты совпадают: {"да" if matches else "нет"}'
+            )
@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+from recipes.images import render_variants
+from recipes.models import Recipe, StoredImage
+from recipes.stamps import bump_recipes_stamp
+
+
+class Command(BaseCommand):
+    """
+    Команда 'build_image_variants' создаёт уменьшенные варианты
+    (RECIPE_IMAGE_VARIANTS) для уже загруженных картинок рецептов.
+    Каждый файл StoredImage обрабатывается один раз, сколько бы
+    рецептов на него ни ссылалось. Картинки обрабатываются в пуле
+    процессов, в БД пишет только основной процесс.
+    """
+
+    help = 'Создаёт варианты картинок рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Количество процессов (1 — без пула).'
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать варианты и для картинок, где они уже есть. '
+                 'Файлы вариантов перезаписываются под прежними именами.'
+        )
+
+    def handle(self, *args, **options):
+        images = StoredImage.objects.filter(references__gt=0)
+        if not options['all']:
+            images = images.filter(variants={})
+        images = list(images.values_list('name', flat=True))
+        render = partial(render_variants, replace=options['all'])
+        if options['workers'] > 1:
+            # Дочерние процессы не должны унаследовать соединения с БД.
+            connections.close_all()
+            with ProcessPoolExecutor(
+                options['workers'],
+                mp_context=multiprocessing.get_context('fork')
+            ) as pool:
+                futures = {
+                    pool.submit(render, name): name for name in images
+                }
+                built, failed = self.save_results(
+                    (futures[future], future.result)
+                    for future in as_completed(futures)
+                )
+        else:
+            built, failed = self.save_results(
+                (name, partial(render, name)) for name in images
+            )
+        if built:
+            bump_recipes_stamp()
+        self.stdout.write(
+            f'Готово: {built}, с ошибками: {failed}, всего: {len(images)}.'
+        )
+
+    def save_results(self, results):
+        built = failed = 0
+        for name, get_variants in results:
+            try:
+                variants = get_variants()
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+                continue
+            StoredImage.objects.filter(name=name).update(variants=variants)
+            Recipe.objects.filter(image=name).update(
+                image_variants=variants, updated_at=timezone.now()
+            )
+            built += 1
+        return built, failed
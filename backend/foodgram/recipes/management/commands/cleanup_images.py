@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.images import delete_orphan_images
+
+
+class Command(BaseCommand):
+    """
+    Команда 'cleanup_images' удаляет файлы картинок рецептов и их
+    варианты, на которые больше не ссылается ни один рецепт. Воркер
+    process_image_jobs запускает ту же чистку сам, когда очередь пуста.
+    """
+
+    help = 'Удаляет файлы картинок без ссылок из рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int,
+            default=settings.RECIPE_IMAGE_ORPHAN_TTL,
+            help='Сколько секунд файл без ссылок хранится до удаления.'
+        )
+
+    def handle(self, *args, **options):
+        deleted = delete_orphan_images(
+            timedelta(seconds=options['older_than'])
+        )
+        self.stdout.write(f'Удалено картинок: {deleted}.')
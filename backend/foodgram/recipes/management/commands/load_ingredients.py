@@ -1,40 +1,179 @@
 import csv
+import json
+import os
+from itertools import islice
+from time import monotonic
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.bulk import COPY_OPTIONS, RowStream
 from recipes.models import Ingredient, Tag
+from recipes.search import bump_ingredients_version
+from recipes.stamps import bump_catalogue_stamp
+
+INGREDIENT_FIELDS = ('name', 'measurement_unit')
+TAG_FIELDS = ('name', 'color', 'slug')
 
 
 class Command(BaseCommand):
     """
-    Команда 'load_ingredients' загружает ингредиенты
-    в базу из csv файла, который располагается в
-    директории /data/
+    Команда 'load_ingredients' загружает ингредиенты и теги
+    в базу из csv или json файлов, которые располагаются в
+    директории /data/. В PostgreSQL строки загружаются через
+    COPY во временную таблицу и сливаются INSERT ... ON CONFLICT
+    в одной транзакции.
     """
 
+    help = 'Загружает ингредиенты и теги из csv или json.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='Файл ингредиентов (.csv или .json).'
+        )
+        parser.add_argument(
+            '--tags',
+            default=os.path.join(settings.BASE_DIR, 'data', 'tag.csv'),
+            help='Файл тегов (.csv или .json).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одной пачке.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Посчитать изменения и откатить транзакцию.'
+        )
+
     def handle(self, *args, **options):
-        self.import_ingredients()
-        self.import_tags()
-        print('Загрузка ингредиентов завершена.')
-
-    def import_ingredients(self, file='ingredients.csv'):
-        print(f'Загрузка {file}...')
-        file_path = f'./data/{file}'
-        with open(file_path, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                status, created = Ingredient.objects.update_or_create(
-                    name=row[0],
-                    measurement_unit=row[1]
-                )
-
-    def import_tags(self, file='tag.csv'):
-        print(f'Загрузка {file}...')
-        file_path = f'./data/{file}'
-        with open(file_path, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                status, created = Tag.objects.update_or_create(
-                    name=row[0],
-                    color=row[1],
-                    slug=row[2]
-                )
+        started = monotonic()
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            self.import_rows(
+                Ingredient, INGREDIENT_FIELDS, ('name', 'measurement_unit'),
+                options['ingredients'], batch_size
+            )
+            self.import_rows(
+                Tag, TAG_FIELDS, ('slug',), options['tags'], batch_size
+            )
+            if options['dry_run']:
+                transaction.set_rollback(True)
+        if options['dry_run']:
+            self.stdout.write('Пробный запуск, изменения отменены.')
+        else:
+            transaction.on_commit(bump_ingredients_version)
+            transaction.on_commit(bump_catalogue_stamp)
+        self.stdout.write(
+            f'Загрузка завершена за {monotonic() - started:.2f} с.'
+        )
+
+    def read_rows(self, path, fields):
+        if not os.path.exists(path):
+            raise CommandError(f'Файл не найден: {path}')
+        if path.endswith('.json'):
+            with open(path, encoding='utf-8') as f:
+                for item in json.load(f):
+                    yield tuple(item[field].strip() for field in fields)
+            return
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if row:
+                    yield tuple(value.strip() for value in row[:len(fields)])
+
+    def import_rows(self, model, fields, key, path, batch_size):
+        self.stdout.write(f'Загрузка {path}...')
+        rows = self.read_rows(path, fields)
+        if connection.vendor == 'postgresql':
+            total, inserted, updated = self.merge_copy(
+                model, fields, key, rows, batch_size
+            )
+        else:
+            total, inserted, updated = self.merge_batches(
+                model, fields, key, rows, batch_size
+            )
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: добавлено {inserted}, '
+            f'обновлено {updated}, без изменений '
+            f'{total - inserted - updated}.'
+        )
+
+    def merge_copy(self, model, fields, key, rows, batch_size):
+        table = model._meta.db_table
+        temp_table = f'{table}_import'
+        columns = ', '.join(fields)
+        values = [field for field in fields if field not in key]
+        if values:
+            current = ', '.join(f'{table}.{field}' for field in values)
+            excluded = ', '.join(f'EXCLUDED.{field}' for field in values)
+            on_conflict = (
+                'DO UPDATE SET '
+                + ', '.join(f'{field} = EXCLUDED.{field}' for field in values)
+                + f' WHERE ({current}) IS DISTINCT FROM ({excluded})'
+            )
+        else:
+            on_conflict = 'DO NOTHING'
+        with connection.cursor() as cursor:
+            # Таблица могла остаться от прошлого вызова в той же
+            # транзакции: ON COMMIT DROP удаляет её только при коммите.
+            cursor.execute(
+                f'CREATE TEMP TABLE IF NOT EXISTS {temp_table} '
+                f'ON COMMIT DROP AS '
+                f'SELECT {columns} FROM {table} WITH NO DATA'
+            )
+            cursor.execute(f'TRUNCATE {temp_table}')
+            cursor.copy_expert(
+                f'COPY {temp_table} ({columns}) FROM STDIN '
+                f'WITH ({COPY_OPTIONS})',
+                RowStream(rows, batch_size)
+            )
+            cursor.execute(
+                f'SELECT COUNT(*) FROM (SELECT DISTINCT ON '
+                f'({", ".join(key)}) 1 FROM {temp_table}) AS import'
+            )
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                f'WITH merged AS ('
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT DISTINCT ON ({", ".join(key)}) {columns} '
+                f'FROM {temp_table} '
+                f'ON CONFLICT ({", ".join(key)}) {on_conflict} '
+                f'RETURNING xmax = 0 AS inserted) '
+                f'SELECT COUNT(*) FILTER (WHERE inserted), '
+                f'COUNT(*) FILTER (WHERE NOT inserted) FROM merged'
+            )
+            inserted, updated = cursor.fetchone()
+        return total, inserted, updated
+
+    def merge_batches(self, model, fields, key, rows, batch_size):
+        total = inserted = updated = 0
+        rows = iter(rows)
+        while True:
+            batch = {
+                tuple(row[fields.index(field)] for field in key): row
+                for row in islice(rows, batch_size)
+            }
+            if not batch:
+                break
+            total += len(batch)
+            existing = {}
+            for obj in model.objects.filter(
+                **{f'{key[0]}__in': [row_key[0] for row_key in batch]}
+            ):
+                existing[tuple(getattr(obj, field) for field in key)] = obj
+            new, changed = [], []
+            for row_key, row in batch.items():
+                obj = existing.get(row_key)
+                values = dict(zip(fields, row))
+                if obj is None:
+                    new.append(model(**values))
+                elif any(getattr(obj, f) != v for f, v in values.items()):
+                    for field, value in values.items():
+                        setattr(obj, field, value)
+                    changed.append(obj)
+            model.objects.bulk_create(new)
+            model.objects.bulk_update(changed, fields)
+            inserted += len(new)
+            updated += len(changed)
+        return total, inserted, updated
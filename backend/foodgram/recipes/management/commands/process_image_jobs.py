@@ -0,0 +1,83 @@
+from datetime import timedelta
+from time import monotonic, sleep
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from recipes.images import (delete_orphan_images, finish_image_job,
+                            process_image_job)
+from recipes.models import ImageJob
+
+
+class Command(BaseCommand):
+    """
+    Команда 'process_image_jobs' — воркер очереди картинок рецептов.
+    Берёт задачи из ImageJob по одной, проверяет и перекодирует
+    загрузку, создаёт варианты и обновляет рецепт. Когда очередь пуста,
+    не чаще --cleanup-interval удаляет файлы картинок без ссылок.
+    Воркеров можно запускать несколько.
+    """
+
+    help = 'Обрабатывает очередь загруженных картинок рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать очередь и завершиться.'
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=2.0,
+            help='Пауза между опросами пустой очереди, секунды.'
+        )
+        parser.add_argument(
+            '--stale-after', type=int, default=600,
+            help='Через сколько секунд зависшая задача берётся снова.'
+        )
+        parser.add_argument(
+            '--max-attempts', type=int, default=3,
+            help='Сколько раз задача берётся в работу.'
+        )
+        parser.add_argument(
+            '--cleanup-interval', type=int, default=3600,
+            help='Как часто удалять картинки без ссылок, секунды '
+                 '(0 — не удалять).'
+        )
+
+    def handle(self, *args, **options):
+        stale_after = timedelta(seconds=options['stale_after'])
+        processed = 0
+        cleaned_at = monotonic()
+        while True:
+            self.fail_exhausted(stale_after, options['max_attempts'])
+            job = ImageJob.objects.claim(stale_after, options['max_attempts'])
+            if job is None:
+                if options['once']:
+                    break
+                interval = options['cleanup_interval']
+                if interval and monotonic() - cleaned_at >= interval:
+                    cleaned_at = monotonic()
+                    delete_orphan_images(
+                        timedelta(seconds=settings.RECIPE_IMAGE_ORPHAN_TTL)
+                    )
+                sleep(options['sleep'])
+                continue
+            status = process_image_job(job)
+            processed += 1
+            self.stdout.write(f'{job.recipe_id}: {status}')
+        self.stdout.write(f'Обработано задач: {processed}.')
+
+    def fail_exhausted(self, stale_after, max_attempts):
+        """ Завершает зависшие задачи, у которых кончились попытки. """
+        with transaction.atomic():
+            jobs = ImageJob.objects.select_for_update(
+                skip_locked=True
+            ).filter(
+                status=ImageJob.PROCESSING,
+                updated_at__lt=timezone.now() - stale_after,
+                attempts__gte=max_attempts,
+            )
+            for job in jobs:
+                finish_image_job(
+                    job, ImageJob.FAILED, error='Превышено число попыток.'
+                )
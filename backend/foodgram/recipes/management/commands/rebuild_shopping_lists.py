@@ -0,0 +1,83 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.transaction import atomic
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    """
+    Команда 'rebuild_shopping_lists' заново строит таблицу
+    списков покупок по корзинам и сверяет её с суммой
+    ингредиентов, посчитанной по рецептам.
+    """
+
+    help = 'Перестраивает и проверяет материализованные списки покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить таблицу, ничего не меняя.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пачки при вставке строк.'
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            self.rebuild(options['batch_size'])
+        mismatches = self.verify()
+        if mismatches:
+            for (user_id, ingredient_id), (stored, live) in mismatches:
+                self.stderr.write(
+                    f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                    f'в таблице {stored}, по рецептам {live}'
+                )
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write('Списки покупок совпадают с корзинами.')
+
+    @atomic
+    def rebuild(self, batch_size):
+        deleted, _ = ShoppingListItem.objects.all().delete()
+        # bulk_create собирает переданные объекты в список, поэтому
+        # строки передаются ему пачками.
+        rows = ShoppingListItem.objects.live_totals().iterator(
+            chunk_size=batch_size
+        )
+        created = 0
+        while True:
+            batch = [
+                ShoppingListItem(
+                    user_id=row['recipe__shoppingcart__user'],
+                    ingredient_id=row['ingredient'],
+                    total_amount=row['total'],
+                )
+                for row in islice(rows, batch_size)
+            ]
+            if not batch:
+                break
+            ShoppingListItem.objects.bulk_create(batch)
+            created += len(batch)
+        self.stdout.write(
+            f'Удалено строк: {deleted}, создано строк: {created}.'
+        )
+
+    def verify(self):
+        stored = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount'
+            ).iterator()
+        }
+        live = {
+            (row['recipe__shoppingcart__user'], row['ingredient']):
+                row['total']
+            for row in ShoppingListItem.objects.live_totals().iterator()
+        }
+        return sorted(
+            (key, (stored.get(key), live.get(key)))
+            for key in stored.keys() | live.keys()
+            if stored.get(key) != live.get(key)
+        )
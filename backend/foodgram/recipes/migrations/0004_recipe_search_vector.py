@@ -0,0 +1,56 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:53
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+INDEX_NAME = 'recipes_recipe_search_vector_gin'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+        'ON recipes_recipe USING gin (search_vector)'
+    )
+    schema_editor.execute(
+        """
+        UPDATE recipes_recipe AS recipe SET search_vector =
+            setweight(to_tsvector('russian', recipe.name), 'A')
+            || setweight(to_tsvector('russian', COALESCE((
+                SELECT string_agg(ingredient.name, ' ')
+                FROM recipes_recipeingredient AS recipe_ingredient
+                JOIN recipes_ingredient AS ingredient
+                    ON ingredient.id = recipe_ingredient.ingredient_id
+                WHERE recipe_ingredient.recipe_id = recipe.id
+            ), '')), 'B')
+            || setweight(to_tsvector('russian', recipe.text), 'C')
+        """
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_ingredient_name_trgm_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='ingredients',
+            field=models.ManyToManyField(related_name='recipes', through='recipes.RecipeIngredient', to='recipes.Ingredient', verbose_name='Ингредиенты в рецепте'),
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:58
+
+from django.db import migrations, models
+
+
+def merge_rows(model, field, keeper_id, duplicate_ids, key, amount):
+    """ Переносит строки model с дубликатов на keeper_id.
+
+    Если у строки с тем же key уже есть пара с keeper_id, количество
+    amount прибавляется к ней, а строка дубликата удаляется.
+    """
+    for row in model.objects.filter(**{f'{field}__in': duplicate_ids}):
+        existing = model.objects.filter(
+            **{key: getattr(row, key), field: keeper_id}
+        ).first()
+        if existing is None:
+            setattr(row, field, keeper_id)
+            row.save(update_fields=[field])
+            continue
+        setattr(existing, amount, getattr(existing, amount)
+                + getattr(row, amount))
+        existing.save(update_fields=[amount])
+        row.delete()
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keeper_id=models.Min('id'), count=models.Count('id')
+    ).filter(count__gt=1).order_by()
+    for group in duplicates:
+        duplicate_ids = list(Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit'],
+        ).exclude(id=group['keeper_id']).values_list('id', flat=True))
+        merge_rows(RecipeIngredient, 'ingredient_id', group['keeper_id'],
+                   duplicate_ids, 'recipe_id', 'amount')
+        merge_rows(ShoppingListItem, 'ingredient_id', group['keeper_id'],
+                   duplicate_ids, 'user_id', 'total_amount')
+        Ingredient.objects.filter(id__in=duplicate_ids).delete()
+    if schema_editor.connection.vendor == 'postgresql':
+        # Отложенные проверки внешних ключей выполняются сейчас, иначе
+        # ALTER TABLE в той же транзакции не пройдёт.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_shoppinglistitem'),
+    ]
+
+    operations = [
+        # Перед ограничением одинаковые (name, measurement_unit)
+        # сливаются в ингредиент с наименьшим id.
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:18
+
+from django.db import migrations, models
+import recipes.storage
+
+
+def fill_stored_images(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    StoredImage = apps.get_model('recipes', 'StoredImage')
+    images = list(Recipe.objects.exclude(image='').values('image').annotate(
+        references=models.Count('id'),
+        variants=models.Max('id'),
+    ).order_by())
+    variants = dict(Recipe.objects.filter(
+        id__in=[row['variants'] for row in images]
+    ).values_list('image', 'image_variants'))
+    StoredImage.objects.bulk_create(
+        (
+            StoredImage(
+                name=row['image'],
+                references=row['references'],
+                variants=variants.get(row['image'], {}),
+            )
+            for row in images
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_image_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('variants', models.JSONField(blank=True, default=dict, verbose_name='Варианты')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Ссылки')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Изменён')),
+            ],
+            options={
+                'verbose_name': 'Файл изображения',
+                'verbose_name_plural': 'Файлы изображений',
+                'ordering': ('name',),
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, storage=recipes.storage.ContentHashStorage(), upload_to='recipes/images/', verbose_name='Изоброжение'),
+        ),
+        migrations.AddIndex(
+            model_name='storedimage',
+            index=models.Index(condition=models.Q(('references', 0)), fields=['updated_at'], name='stored_image_orphan_idx'),
+        ),
+        migrations.RunPython(fill_stored_images, migrations.RunPython.noop),
+    ]
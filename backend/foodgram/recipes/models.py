@@ -1,10 +1,24 @@
+from contextlib import contextmanager
+from threading import local
+
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import (Exists, F, OuterRef, Prefetch, Q, Subquery, Sum,
+                              Value)
+from django.db.models.expressions import RawSQL, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
+
+from .storage import image_storage, upload_storage
 
 User = get_user_model()
 
+SEARCH_CONFIG = 'russian'
+
 
 class Tag(models.Model):
     """ Модель тега. """
@@ -49,6 +63,12 @@ class Ingredient(models.Model):
 
     class Meta:
         ordering = ['name']
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient',
+            ),
+        )
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
@@ -56,6 +76,88 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class ImageStatus:
+    READY = 'ready'
+    PENDING = 'pending'
+    FAILED = 'failed'
+    choices = [
+        (READY, 'Готово'),
+        (PENDING, 'В обработке'),
+        (FAILED, 'Ошибка'),
+    ]
+
+
+class RecipeQuerySet(models.QuerySet):
+    """ QuerySet рецептов для чтения через API. """
+
+    def with_related(self):
+        """ Подгружает автора, теги и ингредиенты для сериализатора. """
+        return self.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'ingridients_recipe',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        )
+
+    def latest_by_author(self, authors, limit=None):
+        """ Последние limit рецептов каждого автора одним запросом. """
+        queryset = self.filter(author__in=authors)
+        if limit is None:
+            return queryset
+        ranked = queryset.annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').desc()],
+            )
+        ).order_by().values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(id__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            'WHERE ranked.row_number <= %s',
+            (*params, limit)
+        ))
+
+    def update_search_vector(self):
+        """ Пересчитывает search_vector по названию, описанию
+            и названиям ингредиентов. Только для PostgreSQL. """
+        if connection.vendor != 'postgresql':
+            return 0
+        ingredient_names = Subquery(
+            RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk')
+            ).values('recipe').annotate(
+                names=StringAgg('ingredient__name', ' ')
+            ).values('names')
+        )
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(
+                Coalesce(ingredient_names, Value('')),
+                weight='B', config=SEARCH_CONFIG
+            )
+            + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+        ))
+
+    def with_user_flags(self, user):
+        """ Аннотирует is_favorited и is_in_shopping_cart для user. """
+        if user.is_anonymous:
+            return self
+        return self.annotate(
+            is_favorited=Exists(Favourite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+
 class Recipe(models.Model):
     """ Модель рецепта. """
 
@@ -63,6 +165,7 @@ class Recipe(models.Model):
         User,
         on_delete=models.CASCADE,
         verbose_name='Автор рецепта',
+        db_index=False,
     )
     name = models.CharField(
         'Название рецепта',
@@ -72,8 +175,21 @@ class Recipe(models.Model):
     image = models.ImageField(
         'Изоброжение',
         upload_to='recipes/images/',
+        storage=image_storage,
         blank=True
     )
+    image_status = models.CharField(
+        'Обработка изображения',
+        max_length=16,
+        choices=ImageStatus.choices,
+        default=ImageStatus.READY,
+    )
+    image_variants = models.JSONField(
+        'Варианты изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         'Описание рецепта'
     )
@@ -87,6 +203,10 @@ class Recipe(models.Model):
         'Время публикации',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        'Время изменения',
+        auto_now=True,
+    )
     ingredients = models.ManyToManyField(
         Ingredient,
         through='RecipeIngredient',
@@ -97,11 +217,30 @@ class Recipe(models.Model):
         Tag,
         verbose_name='Теги',
     )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        # Индекс по author_id не нужен: его заменяет
+        # recipe_author_pub_date_idx.
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx',
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -113,7 +252,8 @@ class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
-        verbose_name='Рецепт'
+        verbose_name='Рецепт',
+        db_index=False,
     )
     ingredient = models.ForeignKey(
         Ingredient,
@@ -128,6 +268,7 @@ class RecipeIngredient(models.Model):
 
     class Meta:
         default_related_name = 'ingridients_recipe'
+        # Поиск по recipe_id идёт по индексу recipe_ingredient_exists.
         constraints = (
             models.UniqueConstraint(
                 fields=('recipe', 'ingredient',),
@@ -152,21 +293,31 @@ class ShoppingCart(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
+        db_index=False,
     )
 
     class Meta:
         verbose_name = 'Рецепт покупок'
         verbose_name_plural = 'Корзина покупок'
+        # Запросы от пользователя идут по unique_cart, от рецепта
+        # (пересчёт списков покупок) — по cart_recipe_user_idx.
         constraints = (
             models.UniqueConstraint(
                 fields=('user', 'recipe'),
                 name='unique_cart',
             ),
         )
+        indexes = (
+            models.Index(
+                fields=('recipe', 'user'),
+                name='cart_recipe_user_idx',
+            ),
+        )
 
     def __str__(self):
         return f'{self.user} добавил "{self.recipe}" в Корзину покупок'
@@ -178,12 +329,14 @@ class Favourite(models.Model):
         User,
         on_delete=models.CASCADE,
         verbose_name='Пользователь',
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
         verbose_name='Рецепт',
         related_name='in_favorite',
+        db_index=False,
     )
 
     class Meta:
@@ -196,6 +349,316 @@ class Favourite(models.Model):
                 name='unique_favorites',
             ),
         )
+        indexes = (
+            models.Index(
+                fields=('recipe', 'user'),
+                name='favourite_recipe_user_idx',
+            ),
+        )
 
     def __str__(self):
         return f'{self.user} добавил "{self.recipe}" в Избранное'
+
+
+class ShoppingListRefresh:
+    """ Пары (пользователь, ингредиент), ждущие пересчёта.
+
+    Рецепты из cart_recipes добавляют пользователей, у которых они
+    в корзине, рецепты из ingredient_recipes — свои ингредиенты.
+    """
+
+    def __init__(self):
+        self.users = set()
+        self.ingredients = set()
+        self.cart_recipes = set()
+        self.ingredient_recipes = set()
+
+    def add(self, users=(), ingredients=(), cart_recipes=(),
+            ingredient_recipes=()):
+        self.users.update(users)
+        self.ingredients.update(ingredients)
+        self.cart_recipes.update(cart_recipes)
+        self.ingredient_recipes.update(ingredient_recipes)
+
+    def resolve(self):
+        users, ingredients = set(self.users), set(self.ingredients)
+        if (not (users or self.cart_recipes)
+                or not (ingredients or self.ingredient_recipes)):
+            return users, ingredients
+        if self.cart_recipes:
+            users.update(ShoppingCart.objects.filter(
+                recipe__in=self.cart_recipes
+            ).values_list('user_id', flat=True))
+        if self.ingredient_recipes:
+            ingredients.update(RecipeIngredient.objects.filter(
+                recipe__in=self.ingredient_recipes
+            ).values_list('ingredient_id', flat=True))
+        return users, ingredients
+
+
+class ShoppingListItemManager(models.Manager):
+    """ Пересчёт материализованного списка покупок. """
+
+    _pending = local()
+
+    @contextmanager
+    def deferred_refresh(self):
+        """ Копит изменения из сигналов и пересчитывает список покупок
+            один раз при выходе из внешнего блока. """
+        pending = getattr(self._pending, 'refresh', None)
+        if pending is not None:
+            yield pending
+            return
+        pending = self._pending.refresh = ShoppingListRefresh()
+        try:
+            yield pending
+        finally:
+            self._pending.refresh = None
+        self.refresh(*pending.resolve())
+
+    def live_totals(self, users=None, ingredients=None):
+        """ Суммы ингредиентов по корзинам, посчитанные по рецептам. """
+        queryset = RecipeIngredient.objects.all()
+        if users is not None:
+            queryset = queryset.filter(recipe__shoppingcart__user__in=users)
+        else:
+            queryset = queryset.filter(recipe__shoppingcart__isnull=False)
+        if ingredients is not None:
+            queryset = queryset.filter(ingredient__in=ingredients)
+        return queryset.values(
+            'recipe__shoppingcart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+
+    def refresh(self, users, ingredients):
+        """ Пересчитывает строки списка покупок для пар
+            (пользователь, ингредиент) из users и ingredients.
+
+            Число запросов не зависит от количества строк.
+        """
+        users = list(users)
+        ingredients = list(ingredients)
+        if not users or not ingredients:
+            return
+        with transaction.atomic():
+            self._refresh(users, ingredients)
+
+    def _refresh(self, users, ingredients):
+        # select_for_update по строкам списка не защищает пары, которых
+        # ещё нет: два пересчёта создали бы одну строку дважды.
+        # Пересчёты одного пользователя идут по очереди, а суммы
+        # читаются уже после блокировки.
+        list(User.objects.select_for_update().filter(
+            pk__in=users
+        ).order_by('pk').values_list('pk', flat=True))
+        totals = {
+            (row['recipe__shoppingcart__user'], row['ingredient']):
+                row['total']
+            for row in self.live_totals(users, ingredients)
+        }
+        existing = {
+            (item.user_id, item.ingredient_id): item
+            for item in self.select_for_update().filter(
+                user__in=users, ingredient__in=ingredients
+            )
+        }
+        stale = [
+            item.pk for key, item in existing.items() if key not in totals
+        ]
+        if stale:
+            self.filter(pk__in=stale).delete()
+        changed = []
+        for key, total in totals.items():
+            item = existing.get(key)
+            if item is not None and item.total_amount != total:
+                item.total_amount = total
+                changed.append(item)
+        self.bulk_update(changed, ['total_amount'])
+        self.bulk_create([
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id,
+                total_amount=total
+            )
+            for (user_id, ingredient_id), total in totals.items()
+            if (user_id, ingredient_id) not in existing
+        ])
+
+
+class ShoppingListItem(models.Model):
+    """ Строка списка покупок: сумма ингредиента по корзине. """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        db_index=False,
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.PositiveIntegerField(
+        'Количество',
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Список покупок'
+        default_related_name = 'shopping_list'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.total_amount}'
+
+
+class ImageJobQuerySet(models.QuerySet):
+
+    def claim(self, stale_after, max_attempts):
+        """ Берёт в работу самую старую задачу.
+
+        Задачи, которые висят в обработке дольше stale_after (воркер
+        упал), берутся повторно, пока не кончатся попытки. В PostgreSQL
+        строки блокируются с SKIP LOCKED, так что воркеров может быть
+        несколько.
+        """
+        stale = timezone.now() - stale_after
+        with transaction.atomic():
+            job = self.select_for_update(skip_locked=True).filter(
+                Q(status=ImageJob.PENDING)
+                | Q(status=ImageJob.PROCESSING, updated_at__lt=stale),
+                attempts__lt=max_attempts,
+            ).order_by('id').first()
+            if job is None:
+                return None
+            job.status = ImageJob.PROCESSING
+            job.attempts += 1
+            job.save(update_fields=('status', 'attempts', 'updated_at'))
+        return job
+
+
+class ImageJob(models.Model):
+    """ Задача обработки загруженной картинки рецепта. """
+
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'В обработке'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='image_jobs',
+        verbose_name='Рецепт',
+    )
+    upload = models.FileField(
+        'Загруженный файл',
+        storage=upload_storage,
+        upload_to='recipes/',
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=16,
+        choices=STATUSES,
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField('Попытки', default=0)
+    error = models.TextField('Ошибка', blank=True)
+    created_at = models.DateTimeField('Создана', auto_now_add=True)
+    updated_at = models.DateTimeField('Изменена', auto_now=True)
+
+    objects = ImageJobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Обработка изображения'
+        verbose_name_plural = 'Обработка изображений'
+        ordering = ('id',)
+        # Выполненные задачи копятся, в индекс попадает только очередь.
+        indexes = (
+            models.Index(
+                fields=('id',),
+                condition=Q(status__in=('pending', 'processing')),
+                name='image_job_queue_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe}: {self.status}'
+
+
+class StoredImageQuerySet(models.QuerySet):
+
+    def touch(self, name):
+        """ Продлевает жизнь файла name перед повторным использованием.
+
+        Строка блокируется, поэтому delete_orphan_images не удалит файл,
+        пока он снова сохраняется. Возвращает варианты картинки.
+        """
+        with transaction.atomic():
+            stored, created = self.select_for_update().get_or_create(
+                name=name
+            )
+            if not created:
+                stored.save(update_fields=('updated_at',))
+        return stored.variants
+
+    def retain(self, name):
+        """ Добавляет ссылку рецепта на файл name. """
+        stored, created = self.get_or_create(
+            name=name, defaults={'references': 1}
+        )
+        if not created:
+            self.filter(pk=stored.pk).update(
+                references=F('references') + 1, updated_at=timezone.now()
+            )
+        return stored
+
+    def release(self, name):
+        """ Убирает ссылку рецепта на файл name. """
+        self.filter(name=name, references__gt=0).update(
+            references=F('references') - 1, updated_at=timezone.now()
+        )
+
+    def orphans(self, older_than):
+        """ Файлы без ссылок, не менявшиеся дольше older_than. """
+        return self.filter(
+            references=0, updated_at__lt=timezone.now() - older_than
+        )
+
+
+class StoredImage(models.Model):
+    """ Файл картинки рецепта в image_storage и число ссылок на него. """
+
+    name = models.CharField('Файл', max_length=255, unique=True)
+    variants = models.JSONField('Варианты', default=dict, blank=True)
+    references = models.PositiveIntegerField('Ссылки', default=0)
+    updated_at = models.DateTimeField('Изменён', auto_now=True)
+
+    objects = StoredImageQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Файл изображения'
+        verbose_name_plural = 'Файлы изображений'
+        ordering = ('name',)
+        indexes = (
+            models.Index(
+                fields=('updated_at',),
+                condition=Q(references=0),
+                name='stored_image_orphan_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.name}: {self.references}'
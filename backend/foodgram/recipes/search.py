@@ -0,0 +1,112 @@
+from bisect import bisect_left
+from itertools import islice
+from threading import Lock
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, Value, When
+
+from .models import Ingredient
+
+INGREDIENTS_VERSION_KEY = 'recipes:ingredients:version'
+
+
+def get_ingredients_version():
+    """ Текущая версия каталога ингредиентов. """
+    version = cache.get(INGREDIENTS_VERSION_KEY)
+    if version is None:
+        cache.add(INGREDIENTS_VERSION_KEY, uuid4().hex, None)
+        version = cache.get(INGREDIENTS_VERSION_KEY)
+    return version
+
+
+def bump_ingredients_version():
+    """ Помечает каталог ингредиентов изменённым. """
+    cache.set(INGREDIENTS_VERSION_KEY, uuid4().hex, None)
+
+
+def search_ingredients(queryset, name, limit=None):
+    """ Сначала ингредиенты, начинающиеся с name, затем содержащие его,
+        не больше limit.
+
+    UPPER(name) LIKE обслуживается триграммным GIN индексом
+    recipes_ingredient_name_upper_trgm.
+    """
+    queryset = queryset.filter(name__icontains=name).annotate(
+        is_substring=Case(
+            When(name__istartswith=name, then=Value(False)),
+            default=Value(True),
+            output_field=BooleanField(),
+        )
+    ).order_by('is_substring', 'name')
+    if limit is None:
+        return queryset
+    return queryset[:limit]
+
+
+class IngredientPrefixIndex:
+    """ Индекс ингредиентов в памяти процесса для поиска по имени.
+
+    Хранит отсортированный массив имён в нижнем регистре и отвечает
+    на запросы бинарным поиском. Перестраивается, когда меняется
+    версия каталога.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._index = ([], [])
+
+    def _build(self, version):
+        rows = sorted(
+            Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).iterator(),
+            key=lambda row: (row[1].casefold(), row[0])
+        )
+        self._index = ([row[1].casefold() for row in rows], rows)
+        self._version = version
+
+    def _refresh(self):
+        version = get_ingredients_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._build(version)
+        return self._index
+
+    def search(self, name, limit=None):
+        """ Сначала ингредиенты, начинающиеся с name, затем содержащие его,
+            не больше limit.
+
+        Имена просматриваются целиком, только если по префиксу нашлось
+        меньше limit ингредиентов, и просмотр останавливается, как
+        только набралось limit.
+        """
+        keys, rows = self._refresh()
+        name = name.casefold()
+        start = bisect_left(keys, name)
+        end = bisect_left(keys, name + chr(0x10FFFF), lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        found = list(range(start, end))
+        if limit is None or len(found) < limit:
+            substrings = (
+                position for position in range(len(keys))
+                if (position < start or position >= end)
+                and name in keys[position]
+            )
+            if limit is not None:
+                substrings = islice(substrings, limit - len(found))
+            found.extend(substrings)
+        return [
+            {
+                'id': rows[position][0],
+                'name': rows[position][1],
+                'measurement_unit': rows[position][2],
+            }
+            for position in found
+        ]
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,225 @@
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from users.models import Subscription, User, UserRole
+
+from .bulk import insert_rows
+from .models import (Favourite, ImageStatus, Ingredient, Recipe,
+                     RecipeIngredient, ShoppingCart, ShoppingListItem, Tag)
+from .search import bump_ingredients_version
+from .stamps import bump_catalogue_stamp, bump_recipes_stamp
+
+BATCH_SIZE = 10000
+# Сколько тегов и ингредиентов в рецепте: от и до.
+RECIPE_TAGS = (1, 3)
+RECIPE_INGREDIENTS = (2, 10)
+# Размер справочников, если они пусты.
+SEED_TAGS = 5
+SEED_INGREDIENTS = 2000
+
+
+def power_law(rng, population, exponent):
+    """ Перемешанная population и накопленные веса для rng.choices:
+        у элемента на месте k вес 1 / k ** exponent. При exponent=0
+        выбор равномерный. """
+    population = list(population)
+    rng.shuffle(population)
+    return population, list(accumulate(
+        1 / rank ** exponent for rank in range(1, len(population) + 1)
+    ))
+
+
+def sample_distinct(rng, population, cum_weights, count, exclude=None):
+    """ До count разных элементов по весам. Повторы отбрасываются и
+        добираются не больше трёх раз, поэтому при сильном перекосе
+        весов элементов может оказаться меньше. """
+    chosen = set()
+    for _ in range(3):
+        missing = count - len(chosen)
+        if missing <= 0:
+            break
+        chosen.update(rng.choices(
+            population, cum_weights=cum_weights, k=missing
+        ))
+        chosen.discard(exclude)
+    return chosen
+
+
+def user_pairs(rng, user_ids, total, population, cum_weights,
+               exclude_self=False):
+    """ Около total пар (пользователь, объект): поровну на
+        пользователя, объекты по весам cum_weights. """
+    share, rest = divmod(total, len(user_ids))
+    limit = len(population) - exclude_self
+    for number, user in enumerate(user_ids):
+        count = min(share + (number < rest), limit)
+        for target in sample_distinct(
+            rng, population, cum_weights, count,
+            exclude=user if exclude_self else None
+        ):
+            yield user, target
+
+
+def new_ids(model, last_id):
+    return list(model.objects.filter(
+        id__gt=last_id
+    ).order_by('id').values_list('id', flat=True))
+
+
+def last_id(model):
+    return model.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+@transaction.atomic
+def seed_database(users, recipes, favourites=0, carts=0, subscriptions=0,
+                  popularity_exponent=1.0, follower_exponent=1.0,
+                  random_seed=1, batch_size=BATCH_SIZE):
+    """ Заполняет базу синтетическими данными для бенчмарков.
+
+    Добавляет users пользователей и recipes рецептов с тегами и
+    ингредиентами; favourites, carts и subscriptions — общее число
+    строк избранного, корзин и подписок, поровну на нового
+    пользователя. Популярность рецептов в избранном и корзинах
+    и число подписчиков (и рецептов) у автора распределены по
+    степенному закону с показателями popularity_exponent и
+    follower_exponent. Строки пишутся через insert_rows (COPY в
+    PostgreSQL). Теги и ингредиенты создаются, только если
+    справочники пусты. Одинаковый random_seed на той же базе даёт
+    одинаковые данные. Возвращает число добавленных строк по таблицам.
+    """
+    rng = random.Random(random_seed)
+    ops = connection.ops
+    now = ops.adapt_datetimefield_value(timezone.now())
+    today = timezone.now().date()
+    # Рецепты публикуются в течение последнего года.
+    dates = [
+        ops.adapt_datefield_value(today - timedelta(days=day))
+        for day in range(365)
+    ]
+    counts = {}
+
+    catalogue = not Tag.objects.exists() or not Ingredient.objects.exists()
+    if not Tag.objects.exists():
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', color='#00FA9A', slug=f'tag{number}')
+            for number in range(SEED_TAGS)
+        )
+    if not Ingredient.objects.exists():
+        insert_rows(
+            Ingredient, ('name', 'measurement_unit'),
+            (
+                (f'ингредиент {number}', 'г')
+                for number in range(SEED_INGREDIENTS)
+            ),
+            batch_size
+        )
+    tags = list(Tag.objects.values_list('id', flat=True))
+    ingredients = list(Ingredient.objects.values_list('id', flat=True))
+
+    first_user = last_id(User)
+    insert_rows(
+        User,
+        ('username', 'email', 'password', 'first_name', 'last_name',
+         'firs_name', 'role', 'is_superuser', 'is_staff', 'is_active',
+         'date_joined'),
+        (
+            (f'seed{number}', f'seed{number}@foodgram.ru', '!', '', '', '',
+             UserRole.USER, False, False, True, now)
+            for number in range(first_user + 1, first_user + users + 1)
+        ),
+        batch_size
+    )
+    user_ids = new_ids(User, first_user)
+    counts['users'] = len(user_ids)
+    if recipes and not user_ids:
+        raise ValueError('Для рецептов нужны новые пользователи-авторы.')
+
+    authors, author_weights = power_law(rng, user_ids, follower_exponent)
+    first_recipe = last_id(Recipe)
+    insert_rows(
+        Recipe,
+        ('author_id', 'name', 'text', 'cooking_time', 'image',
+         'image_status', 'image_variants', 'pub_date', 'updated_at'),
+        (
+            (author, f'Рецепт {number}', 'Описание', rng.randint(1, 120), '',
+             ImageStatus.READY, '{}', rng.choice(dates), now)
+            for number, author in enumerate(rng.choices(
+                authors, cum_weights=author_weights, k=recipes
+            ) if recipes else ())
+        ),
+        batch_size
+    )
+    recipe_ids = new_ids(Recipe, first_recipe)
+    counts['recipes'] = len(recipe_ids)
+    counts['recipe_tags'] = insert_rows(
+        Recipe.tags.through, ('recipe_id', 'tag_id'),
+        (
+            (recipe, tag)
+            for recipe in recipe_ids
+            for tag in rng.sample(
+                tags, min(rng.randint(*RECIPE_TAGS), len(tags))
+            )
+        ),
+        batch_size
+    )
+    counts['recipe_ingredients'] = insert_rows(
+        RecipeIngredient, ('recipe_id', 'ingredient_id', 'amount'),
+        (
+            (recipe, ingredient, rng.randint(1, 500))
+            for recipe in recipe_ids
+            for ingredient in rng.sample(
+                ingredients,
+                min(rng.randint(*RECIPE_INGREDIENTS), len(ingredients))
+            )
+        ),
+        batch_size
+    )
+
+    popular, recipe_weights = power_law(rng, recipe_ids, popularity_exponent)
+    for key, model, field, total, population, weights in (
+        ('favourites', Favourite, 'recipe_id', favourites,
+         popular, recipe_weights),
+        ('carts', ShoppingCart, 'recipe_id', carts,
+         popular, recipe_weights),
+        ('subscriptions', Subscription, 'author_id', subscriptions,
+         authors, author_weights),
+    ):
+        counts[key] = 0
+        if total and population:
+            counts[key] = insert_rows(
+                model, ('user_id', field),
+                user_pairs(
+                    rng, user_ids, total, population, weights,
+                    exclude_self=model is Subscription
+                ),
+                batch_size
+            )
+
+    # Корзины есть только у новых пользователей: их списки покупок
+    # считаются одним INSERT ... SELECT.
+    if counts['carts']:
+        sql, params = ShoppingListItem.objects.live_totals(
+            User.objects.filter(id__gt=first_user)
+        ).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {ShoppingListItem._meta.db_table} '
+                f'(user_id, ingredient_id, total_amount) {sql}',
+                params
+            )
+    if connection.vendor == 'postgresql':
+        Recipe.objects.filter(id__gt=first_recipe).update_search_vector()
+        with connection.cursor() as cursor:
+            for model in (User, Recipe, Recipe.tags.through,
+                          RecipeIngredient, Favourite, ShoppingCart,
+                          Subscription, ShoppingListItem):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+    transaction.on_commit(bump_recipes_stamp)
+    if catalogue:
+        transaction.on_commit(bump_catalogue_stamp)
+        transaction.on_commit(bump_ingredients_version)
+    return counts
@@ -0,0 +1,145 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+from users.models import Subscription, User
+
+from .models import (Favourite, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, ShoppingListItem, StoredImage, Tag)
+from .search import bump_ingredients_version
+from .stamps import bump_catalogue_stamp, bump_recipes_stamp, bump_user_stamp
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(**kwargs):
+    # До коммита другой процесс перестроил бы индекс по старым строкам
+    # и сохранил его под новой версией.
+    transaction.on_commit(bump_ingredients_version)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def catalogue_changed(**kwargs):
+    transaction.on_commit(bump_catalogue_stamp)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_changed(**kwargs):
+    transaction.on_commit(bump_recipes_stamp)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_image(instance, update_fields, **kwargs):
+    if instance._state.adding:
+        instance._saved_image = ''
+    elif update_fields is None or 'image' in update_fields:
+        instance._saved_image = Recipe.objects.filter(
+            pk=instance.pk
+        ).values_list('image', flat=True).first() or ''
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(instance, **kwargs):
+    # Картинки из process_image_job ставятся через update(), ссылки на
+    # них учитывает finish_image_job. Здесь — сохранения модели, например
+    # из админки.
+    saved = getattr(instance, '_saved_image', None)
+    if saved is None or saved == instance.image.name:
+        return
+    if instance.image:
+        variants = StoredImage.objects.retain(instance.image.name).variants
+        Recipe.objects.filter(pk=instance.pk).update(image_variants=variants)
+        instance.image_variants = variants
+    if saved:
+        StoredImage.objects.release(saved)
+    instance._saved_image = instance.image.name
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_deleted(instance, **kwargs):
+    if instance.image:
+        StoredImage.objects.release(instance.image.name)
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def cart_shopping_list_changed(instance, **kwargs):
+    with ShoppingListItem.objects.deferred_refresh() as pending:
+        pending.add(users=[instance.user_id],
+                    ingredient_recipes=[instance.recipe_id])
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_ingredient(instance, **kwargs):
+    # Ингредиент строки можно поменять, например в админке: старый
+    # тоже пересчитывается.
+    instance._saved_ingredient_id = None
+    if not instance._state.adding:
+        instance._saved_ingredient_id = RecipeIngredient.objects.filter(
+            pk=instance.pk
+        ).values_list('ingredient_id', flat=True).first()
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredient_shopping_list_changed(instance, **kwargs):
+    ingredients = {instance.ingredient_id}
+    saved = getattr(instance, '_saved_ingredient_id', None)
+    if saved is not None:
+        ingredients.add(saved)
+    with ShoppingListItem.objects.deferred_refresh() as pending:
+        pending.add(ingredients=ingredients, cart_recipes=[instance.recipe_id])
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_shopping_list(instance, **kwargs):
+    # К post_delete корзины и ингредиенты рецепта уже удалены каскадом.
+    instance._shopping_list = (
+        list(ShoppingCart.objects.filter(
+            recipe=instance
+        ).values_list('user_id', flat=True)),
+        list(instance.ingridients_recipe.values_list(
+            'ingredient_id', flat=True
+        )),
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_shopping_list_deleted(instance, **kwargs):
+    users, ingredients = getattr(instance, '_shopping_list', ((), ()))
+    with ShoppingListItem.objects.deferred_refresh() as pending:
+        pending.add(users=users, ingredients=ingredients)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    # Теги меняются без сохранения рецепта, например tag.recipe_set.add().
+    recipes = Recipe.objects.all()
+    if not reverse:
+        recipes = recipes.filter(pk=instance.pk)
+    elif pk_set is not None:
+        recipes = recipes.filter(pk__in=pk_set)
+    else:
+        recipes = recipes.filter(tags=instance)
+    recipes.update(updated_at=timezone.now())
+    transaction.on_commit(bump_recipes_stamp)
+
+
+@receiver((post_save, post_delete), sender=Favourite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Subscription)
+def user_state_changed(instance, **kwargs):
+    transaction.on_commit(lambda: bump_user_stamp(instance.user_id))
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    # Имя автора входит в представление его рецептов.
+    if Recipe.objects.filter(author=instance).update(
+        updated_at=timezone.now()
+    ):
+        transaction.on_commit(bump_recipes_stamp)
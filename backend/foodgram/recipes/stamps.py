@@ -0,0 +1,53 @@
+from time import time
+
+from django.core.cache import cache
+
+CATALOGUE_STAMP_KEY = 'recipes:stamp:catalogue'
+RECIPES_STAMP_KEY = 'recipes:stamp:recipes'
+USER_STAMP_KEY = 'recipes:stamp:user:{}'
+
+
+def get_stamp(key):
+    """ Время последнего изменения (timestamp) для ключа.
+
+    Если метки нет в кэше, считается, что всё изменилось сейчас:
+    клиенты просто перезапросят данные целиком.
+    """
+    stamp = cache.get(key)
+    if stamp is None:
+        cache.add(key, time(), None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def bump_stamp(key):
+    cache.set(key, time(), None)
+
+
+def get_catalogue_stamp():
+    """ Метка каталога тегов и ингредиентов. """
+    return get_stamp(CATALOGUE_STAMP_KEY)
+
+
+def bump_catalogue_stamp():
+    bump_stamp(CATALOGUE_STAMP_KEY)
+
+
+def get_recipes_stamp():
+    """ Метка всей ленты рецептов: создание, изменение, удаление. """
+    return get_stamp(RECIPES_STAMP_KEY)
+
+
+def bump_recipes_stamp():
+    bump_stamp(RECIPES_STAMP_KEY)
+
+
+def get_user_stamp(user):
+    """ Метка состояния пользователя: избранное, корзина, подписки. """
+    if not user.is_authenticated:
+        return 0
+    return get_stamp(USER_STAMP_KEY.format(user.pk))
+
+
+def bump_user_stamp(user_id):
+    bump_stamp(USER_STAMP_KEY.format(user_id))
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import posixpath
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class UploadStorage(FileSystemStorage):
+    """ Необработанные загрузки картинок до проверки воркером.
+
+    Лежат в IMAGE_UPLOAD_ROOT вне MEDIA_ROOT, чтобы непроверенные
+    файлы не раздавались nginx.
+    """
+
+    @property
+    def base_location(self):
+        return settings.IMAGE_UPLOAD_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+upload_storage = UploadStorage()
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    """ Картинки рецептов в MEDIA_ROOT с именами по SHA-256 содержимого.
+
+    Файл recipes/images/photo.png сохраняется как
+    recipes/images/ab/<остаток хеша>.png. Одинаковые картинки хранятся
+    один раз, а содержимое файла по одному адресу не меняется, поэтому
+    nginx отдаёт их с Cache-Control: immutable. Варианты в variants/
+    называются по оригиналу и могут пересоздаваться, на них immutable
+    не распространяется. Файлы не удаляются при
+    замене картинки: на один файл могут ссылаться несколько рецептов,
+    учёт ссылок ведёт recipes.models.StoredImage.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        return posixpath.join(
+            posixpath.dirname(name), digest[:2],
+            digest[2:] + posixpath.splitext(name)[1].lower()
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return self.store(self.hashed_name(name, content), content, max_length)
+
+    def store(self, name, content, max_length=None):
+        """ Сохраняет файл под именем name, если его ещё нет. """
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Одно имя — одно содержимое, файл под ним можно не переименовывать.
+        return name
+
+    def _save(self, name, content):
+        # Файл пишется рядом и переименовывается: под итоговым именем
+        # никогда не бывает недописанного содержимого.
+        partial = super()._save(f'{name}.{uuid4().hex}.part', content)
+        os.replace(self.path(partial), self.path(name))
+        return name
+
+
+image_storage = ContentHashStorage()
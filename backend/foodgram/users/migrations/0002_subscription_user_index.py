@@ -0,0 +1,24 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from foodgram.operations import AlterIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # Отдельный индекс по user_id не нужен: поиск по user_id идёт
+    # по индексу ограничения unique_subscription (user, author).
+    atomic = False
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        AlterIndexConcurrently(
+            model_name='subscription',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='follower', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик'),
+        ),
+    ]
@@ -64,7 +64,8 @@ class Subscription(models.Model):
         User,
         related_name='follower',
         on_delete=models.CASCADE,
-        verbose_name='Подписчик'
+        verbose_name='Подписчик',
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
@@ -76,6 +77,7 @@ class Subscription(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        # Подписки пользователя ищутся по индексу unique_subscription.
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'],